@@ -1,115 +1,403 @@
 from tetris import Tetris
-from playTetris import TetrisWindow
+try:
+    from playTetris import TetrisWindow
+    from tkinter import NE, simpledialog
+except ImportError:
+    # no tkinter, e.g. on a headless training box. everything but the
+    # windows below still works
+    TetrisWindow = object
 import random
 import pickle
-from controller import Controller
+import time
+from controller import Controller, SparseController, PlacementController, \
+        BatchController, FeatureController
+import numpy as np
+from sparseObservation import SparseBoardObservation
+from features import BoardFeatures
+from replay import ReplayWriter, ReplayReader, isReplayFile, writeReplay
 
 class AutomatedTetris():
 
     FPS = 10
 
-    def __init__(self, controller, initrandomstate=None, recordMoves=True):
+    # tetrisClass: Tetris or an engine with the same API, e.g. BitboardTetris
+    # pieceSequence: see Tetris.__init__
+    def __init__(self, controller, initrandomstate=None, recordMoves=True,
+            tetrisClass=Tetris, pieceSequence=None):
         self.controller = controller
-        self.tetris = Tetris(initrandomstate=initrandomstate)
+        self.tetris = tetrisClass(initrandomstate=initrandomstate,
+                pieceSequence=pieceSequence)
+        self.observation = None
+        self.features = None
+        if isinstance(controller, SparseController):
+            self.observation = SparseBoardObservation(self.tetris)
+        elif isinstance(controller, FeatureController):
+            self.features = BoardFeatures(self.tetris)
         self.recordMoves = recordMoves
         self.moves = []
         self.gameLength = 0
+        self.replayWriter = None
+
+    # streams the game to a replay file as it is played, see replay.py.
+    # call before the first step, the file is finished when play returns
+    def recordReplay(self, filename, seed=None, keyframeInterval=1000):
+        self.replayWriter = ReplayWriter(filename, self.tetris,
+                AutomatedTetris.FPS, seed, keyframeInterval)
 
     def step(self):
+        return self.stepWithMove(None)
+
+    # True if the next step is a gravity tick, on which no move is made
+    def isGravityTick(self):
+        return (self.gameLength + 1) % AutomatedTetris.FPS == 0
+
+    # a step that makes move m, if it is not a gravity tick, instead of
+    # asking the controller. with m None it asks the controller
+    def stepWithMove(self, m):
         if self.tetris.gameOver:
             return False
+        if self.replayWriter is not None:
+            self.replayWriter.beforeTick(self)
         self.gameLength += 1
         if self.gameLength % AutomatedTetris.FPS == 0:
-            return self.tetris.step()
+            return self.gravity()
         else:
-            m = self.controller.getMove(self.tetris.boardAsArray())
-            #m = self.controller.getMove(self.tetris.topFourNonemptyRowsAndShadowAsArray())
+            if m is None:
+                m = self.getMove()
             if self.recordMoves:
                 self.moves.append(m)
-            if m == Tetris.LEFT:
-                self.tetris.tryMoveLeft()
-            elif m == Tetris.RIGHT:
-                self.tetris.tryMoveRight()
-            elif m == Tetris.ROTATE:
-                self.tetris.tryRotateClockwise()
-            elif m == Tetris.DOWN:
-                self.tetris.tryMoveDown()
-            elif m == Tetris.DROP:
-                self.tetris.dropFallingPiece()
-            elif m == Tetris.NOP:
-                pass
+            if self.replayWriter is not None:
+                self.replayWriter.recordMove(m)
+            self.applyMove(m)
             return True
 
+    def gravity(self):
+        return self.tetris.step()
+
+    def getMove(self):
+        if self.features is not None:
+            return self.controller.getMoveFeatures(self.features.asArray())
+        if self.observation is None:
+            return self.controller.getMove(self.tetris.boardAsArray())
+        return self.controller.getMoveSparse(self.observation.activeIndices())
+        #return self.controller.getMove(self.tetris.topFourNonemptyRowsAndShadowAsArray())
+
+    def applyMove(self, m):
+        if m == Tetris.LEFT:
+            self.tetris.tryMoveLeft()
+        elif m == Tetris.RIGHT:
+            self.tetris.tryMoveRight()
+        elif m == Tetris.ROTATE:
+            self.tetris.tryRotateClockwise()
+        elif m == Tetris.DOWN:
+            self.tetris.tryMoveDown()
+        elif m == Tetris.DROP:
+            self.tetris.dropFallingPiece()
+        elif m == Tetris.NOP:
+            pass
+
     def score(self):
         return self.tetris.score
 
-    def play(self, maxMoves=-1):
+    # stopPolicies: earlyStopping.EarlyStopPolicy objects that may end the
+    # game before it is over or maxMoves ticks have been played
+    def play(self, maxMoves=-1, stopPolicies=()):
+        stoppedBy = None
+        if stopPolicies:
+            stoppedBy = self.playWithStopPolicies(maxMoves, stopPolicies)
+        else:
+            moveCount = 0
+            while not self.tetris.gameOver and moveCount != maxMoves:
+                moveCount += 1
+                self.step()
+        if self.replayWriter is not None:
+            self.replayWriter.close(self)
+        return stoppedBy
+
+    # returns the policy that stopped the game, or None
+    def playWithStopPolicies(self, maxMoves, stopPolicies):
+        for policy in stopPolicies:
+            policy.start(self, maxMoves)
         moveCount = 0
         while not self.tetris.gameOver and moveCount != maxMoves:
             moveCount += 1
             self.step()
+            for policy in stopPolicies:
+                if policy.shouldStop(self):
+                    policy.stopped(maxMoves-moveCount if maxMoves >= 0 else 0)
+                    return policy
+        return None
 
+    # only for games drawing their pieces from initrandomstate
     def saveGame(self, filename):
+        if self.tetris.initrandomstate is None:
+            raise ValueError("saveGame needs a random.Random game, use saveReplay")
         with open(filename, "wb") as f:
             pickle.dump((self.tetris.initrandomstate,self.moves), f) 
 
+    # the recorded moves in the binary replay format, see replay.py
+    def saveReplay(self, filename, seed=None):
+        writeReplay(filename, self, seed)
+
+# Asks a PlacementController where to put each piece instead of asking a
+# Controller for a move every tick, so one step places one piece. moves
+# records (rotation, column) pairs and maxMoves counts pieces.
+class AutomatedPlacementTetris(AutomatedTetris):
+
+    def step(self):
+        if self.tetris.gameOver:
+            return False
+        self.gameLength += 1
+        placements = self.tetris.placements()
+        if not placements:
+            self.tetris.dropFallingPiece()
+            return True
+        p = self.controller.getPlacement(placements)
+        if self.recordMoves:
+            self.moves.append((p.rotation, p.column))
+        self.tetris.commitPlacement(p.rotation, p.column)
+        return True
+
+# Plays many AutomatedTetris games in lockstep, asking a BatchController for
+# the moves of all live games at once each tick instead of asking every
+# game's controller separately. Games behave exactly as if each had been
+# played with step; the controllers they were made with are not used.
+#   games = [AutomatedTetris(None, trialRandomState(t)) for t in range(64)]
+#   LockstepTetris(games, BatchNeuralNetworkController(net)).play(6000)
+class LockstepTetris():
+
+    def __init__(self, games, batchController):
+        self.games = list(games)
+        self.batchController = batchController
+
+    def liveGames(self):
+        return [g for g in self.games if not g.tetris.gameOver]
+
+    # one tick of every live game, returns False once all are over
+    def step(self):
+        live = self.liveGames()
+        if not live:
+            return False
+        movers = [g for g in live if not g.isGravityTick()]
+        if len(movers) < len(live):
+            for g in live:
+                if g.isGravityTick():
+                    g.step()
+        if movers:
+            boards = np.array([g.tetris.boardAsArray() for g in movers])
+            for g, m in zip(movers, self.batchController.getMoves(boards)):
+                g.stepWithMove(int(m))
+        return True
+
+    # plays until every game is over or has played maxMoves ticks, returns
+    # the scores
+    def play(self, maxMoves=-1):
+        tick = 0
+        while tick != maxMoves and self.step():
+            tick += 1
+        for g in self.games:
+            if g.replayWriter is not None:
+                g.replayWriter.close(g)
+        return [g.score() for g in self.games]
+
 class RandomController(Controller):
     def getMove(self, board):
         return random.choice([Tetris.LEFT, Tetris.RIGHT, Tetris.ROTATE,
             Tetris.DOWN, Tetris.DROP, Tetris.NOP])
 
+class BatchRandomController(BatchController):
+    def __init__(self, rng=None):
+        self.rng = rng or np.random.default_rng()
+
+    def getMoves(self, boards):
+        return self.rng.choice([Tetris.LEFT, Tetris.RIGHT, Tetris.ROTATE,
+            Tetris.DOWN, Tetris.DROP, Tetris.NOP], size=len(boards))
+
+class RandomPlacementController(PlacementController):
+    def getPlacement(self, placements):
+        return random.choice(placements)
+
 class AutomatedTetrisMovie(AutomatedTetris):
 
     class MovieController(Controller):
-        def __init__(self, moves):
-            self.moves = moves
-            self.index = 0
+        # moves: any iterable, it is only read as far as the game goes
+        # movesFrom: movesFrom(index) gives the moves from index on, for seek
+        def __init__(self, moves, index=0, movesFrom=None):
+            self.moves = iter(moves)
+            self.index = index
+            self.movesFrom = movesFrom
 
         def getMove(self, board):
-            if self.index >= len(self.moves):
+            move = next(self.moves, None)
+            if move is None:
                 return Tetris.NOP
-            move = self.moves[self.index]
             self.index += 1
             return move
 
-        def step(self):
-            if self.index < len(self.moves):
-                AutomatedTetris.step(self)
+        def seek(self, index):
+            self.moves = self.movesFrom(index)
+            self.index = index
+
+    # the movie remembers its state every this many ticks, to seek backward
+    SNAPSHOT_INTERVAL = 200
+
+    # filename: a game saved by saveGame or saveReplay. binary replays can be
+    # started at any tick, from the last keyframe before it
+    def __init__(self, filename, tick=0, tetrisClass=Tetris):
+        self.replay = None
+        if not isReplayFile(filename):
+            with open(filename, "rb") as f:
+                initrandomstate, moves = pickle.load(f)
+            controller = AutomatedTetrisMovie.MovieController(moves,
+                    movesFrom=lambda index: iter(moves[index:]))
+            AutomatedTetris.__init__(self, controller, initrandomstate,
+                    tetrisClass=tetrisClass)
+            self.snapshots = {0: (0, self.tetris.snapshot())}
+            self.seekTick(tick)
+            return
+        reader = ReplayReader(filename)
+        controller = AutomatedTetrisMovie.MovieController([], movesFrom=reader.moves)
+        AutomatedTetris.__init__(self, controller, reader.initrandomstate,
+                tetrisClass=tetrisClass, pieceSequence=reader.newPieceSequence())
+        controller.seek(0)
+        self.replay = reader
+        # gameLength: (moveIndex, Tetris.snapshot())
+        self.snapshots = {0: (0, self.tetris.snapshot())}
+        self.seekTick(tick)
+
+    def step(self):
+        if self.gameLength % AutomatedTetrisMovie.SNAPSHOT_INTERVAL == 0 and \
+                self.gameLength not in self.snapshots:
+            self.snapshots[self.gameLength] = (self.controller.index,
+                    self.tetris.snapshot())
+        return AutomatedTetris.step(self)
 
-    def __init__(self, filename):
-        with open(filename, "rb") as f:
-            initrandomstate, moves = pickle.load(f)
-        controller = AutomatedTetrisMovie.MovieController(moves)
-        AutomatedTetris.__init__(self, controller, initrandomstate)
+    def restoreState(self, gameLength):
+        moveIndex, snapshot = self.snapshots[gameLength]
+        self.tetris.restore(snapshot)
+        self.gameLength = gameLength
+        self.controller.seek(moveIndex)
 
+    # Goes to the first state that is not before the target: back to the
+    # last remembered state before it (or the first one) if needed, or
+    # ahead to one if that saves ticks, and from there forward tick by tick.
+    # before(gameLength, piecesPlaced): if a state is before the target
+    def seek(self, before):
+        best = 0
+        for gameLength in sorted(self.snapshots):
+            if before(gameLength, self.snapshots[gameLength][1].piecesPlaced):
+                best = gameLength
+        if best > self.gameLength or \
+                not before(self.gameLength, self.tetris.piecesPlaced):
+            self.restoreState(best)
+        while before(self.gameLength, self.tetris.piecesPlaced) and \
+                not self.tetris.gameOver:
+            self.step()
+
+    # goes to tick, or the end of the game if it is shorter. binary replays
+    # also start from their keyframes
+    def seekTick(self, tick):
+        keyframe = None
+        if self.replay is not None:
+            keyframe = self.replay.keyframeBefore(tick)
+        if keyframe is not None and self.gameLength < keyframe[0] and \
+                max(self.snapshots) < keyframe[0]:
+            self.gameLength, moveIndex = self.replay.restoreKeyframe(keyframe, self.tetris)
+            self.controller.seek(moveIndex)
+        self.seek(lambda gameLength, piecesPlaced: gameLength < tick)
+
+    # goes to the first tick after the piece-th piece was placed
+    def seekPiece(self, piece):
+        self.seek(lambda gameLength, piecesPlaced: piecesPlaced < piece)
+
+# Shows an AutomatedTetris game. The simulation runs on its own clock at
+# ticksPerSecond, as many ticks per frame as that takes, while the window
+# is still redrawn at most REFRESH_RATE times a second. If the ticks of a
+# frame take too long the simulation just runs as fast as it can.
+# keys: p pause, + and - double or halve the speed, and for movies
+# Right/Left the next/previous piece, Home the start, g a tick, n a piece
 class AutomatedTetrisWindow(TetrisWindow):
+
+    MIN_TICKS_PER_SECOND = 0.25
+    MAX_TICKS_PER_SECOND = 1 << 16
+    # the part of a frame the simulation may use
+    SIMULATION_SHARE = 0.8
     
     def __init__(self, autoTetris, shadowsEnabled=False):
         TetrisWindow.__init__(self, shadowsEnabled, automated=True)
-        self.delay = 1000
+        self.ticksPerSecond = 1.0
+        self.tickDebt = 0.0
         self.autoTetris = autoTetris
         self.game = autoTetris.tetris
         self.refreshTimerFired()
         self.bind("<Key>", self.keyPressed)
-        self.canvas.after(self.delay, self.stepMovie)
-
-    def stepMovie(self):
-        if not self.game.isPaused:
-            self.autoTetris.step()
-            self.needToRedraw = True 
-        self.canvas.after(self.delay, self.stepMovie)
-        
+        self.lastSimulation = time.perf_counter()
+        self.canvas.after(TetrisWindow.REFRESH_MILLIS, self.simulationTimerFired)
+
+    def simulationTimerFired(self):
+        now = time.perf_counter()
+        elapsed = now - self.lastSimulation
+        self.lastSimulation = now
+        if not self.game.isPaused and not self.game.gameOver:
+            self.tickDebt += elapsed * self.ticksPerSecond
+            deadline = now + AutomatedTetrisWindow.SIMULATION_SHARE * \
+                    TetrisWindow.REFRESH_MILLIS / 1000
+            ticks = 0
+            while self.tickDebt >= 1 and not self.game.gameOver:
+                self.autoTetris.step()
+                self.tickDebt -= 1
+                ticks += 1
+                if ticks % 64 == 0 and time.perf_counter() > deadline:
+                    # falling behind, do not try to catch up later
+                    self.tickDebt = 0.0
+            if ticks:
+                self.needToRedraw = True
+        self.canvas.after(TetrisWindow.REFRESH_MILLIS, self.simulationTimerFired)
+
+    def createItems(self):
+        TetrisWindow.createItems(self)
+        x0, y0, x1, y1 = self.boardBox
+        fontSize = (y1-y0)//30 #in pixels
+        self.statusItem = self.canvas.create_text(x1, y0, text="", anchor=NE,
+                font=("DejaVu sans mono", -fontSize, "bold"), fill="white")
+
+    def drawGame(self):
+        TetrisWindow.drawGame(self)
+        self.setText(self.statusItem, "tick {} piece {}\n{:g} ticks/s".format(
+            self.autoTetris.gameLength, self.game.piecesPlaced, self.ticksPerSecond))
+
+    def askNumber(self, title):
+        return simpledialog.askinteger(title, title, parent=self, minvalue=0)
+
     def keyPressed(self, event):
         #print("key pressed with char", event.char, "keysym", event.keysym)
-        if event.keysym == "p":
+        key = event.keysym
+        movie = self.autoTetris if isinstance(self.autoTetris, AutomatedTetrisMovie) else None
+        if key == "p":
             self.game.togglePaused()
-        elif self.game.gameOver or self.game.isPaused:
+        elif key in ("plus", "equal", "KP_Add"):
+            self.ticksPerSecond = min(2*self.ticksPerSecond,
+                    AutomatedTetrisWindow.MAX_TICKS_PER_SECOND)
+        elif key in ("minus", "KP_Subtract"):
+            self.ticksPerSecond = max(self.ticksPerSecond/2,
+                    AutomatedTetrisWindow.MIN_TICKS_PER_SECOND)
+        elif movie is None:
             return
-        elif event.keysym == "minus":
-            if self.delay > 50:
-                self.delay -= 50
-        elif event.keysym == "plus":
-            self.delay += 50
+        elif key == "Right":
+            movie.seekPiece(self.game.piecesPlaced+1)
+        elif key == "Left":
+            movie.seekPiece(self.game.piecesPlaced-1)
+        elif key == "Home":
+            movie.seekTick(0)
+        elif key == "g":
+            tick = self.askNumber("Go to tick")
+            if tick is not None:
+                movie.seekTick(tick)
+        elif key == "n":
+            piece = self.askNumber("Go to piece")
+            if piece is not None:
+                movie.seekPiece(piece)
+        self.tickDebt = 0.0
         self.needToRedraw = True
 
     def play(self):
@@ -0,0 +1,183 @@
+from tetris import Tetris
+from automatedTetris import AutomatedTetris
+from pieceSequence import RandomPieceSequence
+import numpy as np
+import random
+
+# Steps N games of Tetris at once, the way N AutomatedTetris instances would
+# be stepped: every AutomatedTetris.FPS-th tick is a gravity tick, every other
+# tick applies one move per game. All boards live in one (N, rows, cols)
+# array and moves, gravity, placement, line clears, scoring and game over
+# detection are numpy ops over the games they concern. Only spawning a new
+# piece loops in python, so that each game draws its pieces from its own
+# piece sequence exactly like Tetris.newFallingPiece does.
+class BatchTetris:
+
+    POINTS = np.array([0, 40, 100, 300, 1200])
+
+    # initrandomstates: one random state (or None) per game
+    # pieceSequences: one pieceSequence.PieceSequence per game to use
+    #   instead of initrandomstates, which is then ignored
+    def __init__(self, initrandomstates, rows=None, cols=None, pieceSequences=None):
+        if rows == None: rows = Tetris.DEFAULT_ROWS
+        if cols == None: cols = Tetris.DEFAULT_COLS
+        self.rows, self.cols = rows, cols
+        if pieceSequences is not None:
+            initrandomstates = [None]*len(pieceSequences)
+        self.n = n = len(initrandomstates)
+        self.computePieceTables()
+        self.boards = np.zeros((n, rows, cols), dtype=np.int8)
+        self.scores = np.zeros(n, dtype=int)
+        self.gameOver = np.zeros(n, dtype=bool)
+        self.gameLength = np.zeros(n, dtype=int)
+        self.tick = 0
+        self.pieces = np.zeros(n, dtype=int)
+        self.rotations = np.zeros(n, dtype=int)
+        self.pieceRows = np.zeros(n, dtype=int)
+        self.pieceCols = np.zeros(n, dtype=int)
+        if pieceSequences is None:
+            pieceSequences = []
+            for initrandomstate in initrandomstates:
+                rng = random.Random()
+                if initrandomstate:
+                    rng.setstate(initrandomstate)
+                pieceSequences.append(RandomPieceSequence(rng, len(self.reps)))
+        self.pieceSequences = list(pieceSequences)
+        self.newFallingPieces(np.arange(n))
+
+    def computePieceTables(self):
+        classes = Tetris.tetriminoClasses(None)
+        numClasses = len(classes)
+        self.cells = np.zeros((numClasses, 4, 4, 2), dtype=int)
+        self.spawnRows = np.zeros((numClasses, 4), dtype=int)
+        self.nextRotation = np.zeros((numClasses, 4), dtype=int)
+        self.reps = np.array([clazz.rep for clazz in classes], dtype=np.int8)
+        self.rotates = np.ones(numClasses, dtype=bool)
+        for p, clazz in enumerate(classes):
+            # Tetrimino_O overrides rotation to do nothing
+            t = clazz(None, 0, 0)
+            t.rotateClockwise()
+            self.rotates[p] = t.maskIndex != 0
+            for k in range(4):
+                ar, ac = clazz.anchors[k]
+                self.cells[p, k] = [(r-ar, c-ac) for r, c in clazz.masks[k]]
+                self.spawnRows[p, k] = -self.cells[p, k, :, 0].min()
+                self.nextRotation[p, k] = (k+1) % 4 if self.rotates[p] else k
+
+    def liveIndices(self):
+        return np.flatnonzero(~self.gameOver)
+
+    def isGravityTick(self):
+        return (self.tick + 1) % AutomatedTetris.FPS == 0
+
+    def pieceCells(self, idx, rotations=None, dRow=0, dCol=0):
+        if rotations is None:
+            rotations = self.rotations[idx]
+        cells = self.cells[self.pieces[idx], rotations]
+        r = cells[:, :, 0] + (self.pieceRows[idx] + dRow)[:, None]
+        c = cells[:, :, 1] + (self.pieceCols[idx] + dCol)[:, None]
+        return r, c
+
+    def fits(self, idx, rotations=None, dRow=0, dCol=0):
+        r, c = self.pieceCells(idx, rotations, dRow, dCol)
+        inBounds = (r >= 0) & (r < self.rows) & (c >= 0) & (c < self.cols)
+        occupied = self.boards[idx[:, None],
+                np.clip(r, 0, self.rows-1), np.clip(c, 0, self.cols-1)] != 0
+        return (inBounds & ~occupied).all(axis=1)
+
+    # moves: one Tetris move per game, ignored for finished games and on
+    # gravity ticks. returns False once every game is over
+    def step(self, moves=None):
+        live = self.liveIndices()
+        if live.size == 0:
+            return False
+        self.tick += 1
+        self.gameLength[live] += 1
+        if self.tick % AutomatedTetris.FPS == 0:
+            self.moveDown(live)
+            return True
+        moves = np.asarray(moves)[live]
+        self.tryShift(live[moves == Tetris.LEFT], -1)
+        self.tryShift(live[moves == Tetris.RIGHT], 1)
+        self.tryRotate(live[moves == Tetris.ROTATE])
+        self.moveDown(live[moves == Tetris.DOWN])
+        self.drop(live[moves == Tetris.DROP])
+        return True
+
+    def tryShift(self, idx, dCol):
+        ok = self.fits(idx, dCol=dCol)
+        self.pieceCols[idx[ok]] += dCol
+
+    def tryRotate(self, idx):
+        rotations = self.nextRotation[self.pieces[idx], self.rotations[idx]]
+        ok = self.fits(idx, rotations=rotations)
+        self.rotations[idx[ok]] = rotations[ok]
+
+    # same as Tetris.step for each game in idx
+    def moveDown(self, idx):
+        ok = self.fits(idx, dRow=1)
+        self.pieceRows[idx[ok]] += 1
+        self.lockFallingPieces(idx[~ok])
+
+    # same as Tetris.dropFallingPiece for each game in idx
+    def drop(self, idx):
+        while idx.size > 0:
+            ok = self.fits(idx, dRow=1)
+            self.lockFallingPieces(idx[~ok])
+            idx = idx[ok]
+            self.pieceRows[idx] += 1
+
+    def lockFallingPieces(self, idx):
+        if idx.size == 0:
+            return
+        r, c = self.pieceCells(idx)
+        self.boards[idx[:, None], r, c] = self.reps[self.pieces[idx]][:, None]
+        self.deleteCompleteRows(idx)
+        self.newFallingPieces(idx)
+        self.gameOver[idx] = ~self.fits(idx)
+
+    def deleteCompleteRows(self, idx):
+        boards = self.boards[idx]
+        complete = (boards != 0).all(axis=2)
+        deleted = complete.sum(axis=1)
+        self.scores[idx] += BatchTetris.POINTS[deleted]
+        hasDeleted = deleted > 0
+        if not hasDeleted.any():
+            return
+        idx, boards = idx[hasDeleted], boards[hasDeleted]
+        complete, deleted = complete[hasDeleted], deleted[hasDeleted]
+        # stable sort puts complete rows on top, the rest keep their order
+        order = np.argsort(~complete, axis=1, kind="stable")
+        boards = np.take_along_axis(boards, order[:, :, None], axis=1)
+        boards[np.arange(self.rows)[None, :] < deleted[:, None]] = 0
+        self.boards[idx] = boards
+
+    def newFallingPieces(self, idx):
+        for i in idx:
+            p, k = self.pieceSequences[i].nextPiece()
+            self.pieces[i] = p
+            self.rotations[i] = k if self.rotates[p] else 0
+        self.pieceRows[idx] = self.spawnRows[self.pieces[idx], self.rotations[idx]]
+        self.pieceCols[idx] = self.cols//2 - 1
+
+    # the stacked Tetris.boardAsArray of the games in idx, live games by default
+    def boardsAsArray(self, idx=None):
+        if idx is None:
+            idx = self.liveIndices()
+        arr = np.minimum(1, self.boards[idx]).astype(float)
+        r, c = self.pieceCells(idx)
+        arr[np.arange(len(idx))[:, None], r, c] = 1
+        return arr.reshape(len(idx), self.rows*self.cols)
+
+    # getMoves: maps the (live games, rows*cols) observations to one move per
+    # live game. plays until every game is over or maxMoves ticks have passed
+    def play(self, getMoves, maxMoves=-1):
+        moves = np.full(self.n, Tetris.NOP)
+        while not self.gameOver.all() and self.tick != maxMoves:
+            if self.isGravityTick():
+                self.step()
+            else:
+                live = self.liveIndices()
+                moves[live] = getMoves(self.boardsAsArray(live))
+                self.step(moves)
+        return self.scores
@@ -0,0 +1,181 @@
+from tetris import Tetris
+from bitboardTetris import BitboardTetris
+from automatedTetris import AutomatedTetris
+from compiledNetwork import compileNetwork
+from train import NeuralNetworkController, eval_genomes
+import argparse
+import json
+import pickle
+import platform
+import random
+import sys
+import time
+import numpy as np
+
+# Benchmarks for the engines, the controllers and one training generation,
+# all with fixed seeds so that runs are comparable. Results are written as
+# JSON; pass an earlier result file to --compare to spot regressions.
+#   python benchmark.py --engine numpy bitboard --output bench.json
+#   python benchmark.py --quick --compare bench.json
+
+ENGINES = {"numpy": Tetris, "bitboard": BitboardTetris}
+SEED = 0
+
+def newGame(tetrisClass, seed=SEED):
+    return tetrisClass(initrandomstate=random.Random(seed).getstate())
+
+# calls op(game) n times, starting a new game whenever one ends
+def timeGameOp(tetrisClass, op, n):
+    game = newGame(tetrisClass)
+    seed = SEED
+    elapsed = 0.0
+    for i in range(n):
+        if game.gameOver:
+            seed += 1
+            game = newGame(tetrisClass, seed)
+        start = time.perf_counter()
+        op(game)
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+def result(n, elapsed, **info):
+    info.update({"n": n, "seconds": elapsed, "opsPerSecond": n / elapsed})
+    return info
+
+def benchGameOps(tetrisClass, n):
+    ops = {
+        "step": lambda g: g.step(),
+        "tryMoveLeft": lambda g: g.tryMoveLeft(),
+        "tryMoveRight": lambda g: g.tryMoveRight(),
+        "tryRotateClockwise": lambda g: g.tryRotateClockwise(),
+        "tryMoveDown": lambda g: g.tryMoveDown(),
+        "boardAsArray": lambda g: g.boardAsArray(),
+    }
+    return {name: result(n, timeGameOp(tetrisClass, op, n))
+            for name, op in ops.items()}
+
+# boards whose bottom `cleared` rows are complete under some rubble
+def boardWithCompleteRows(rows, cols, cleared, rng):
+    board = np.zeros((rows, cols), dtype=int)
+    for r in range(rows-4, rows):
+        board[r] = [rng.randint(1, 7) for c in range(cols)]
+        if r < rows-cleared:
+            board[r][rng.randrange(cols)] = 0
+    return board
+
+def benchDeleteCompleteRows(tetrisClass, n):
+    results = {}
+    game = newGame(tetrisClass)
+    rng = random.Random(SEED)
+    for cleared in range(5):
+        boards = [boardWithCompleteRows(game.rows, game.cols, cleared, rng)
+                for i in range(100)]
+        elapsed = 0.0
+        for i in range(n):
+            game.loadBoard(boards[i % len(boards)].copy())
+            start = time.perf_counter()
+            game.deleteCompleteRows()
+            elapsed += time.perf_counter() - start
+        results["deleteCompleteRows{}".format(cleared)] = result(n, elapsed)
+    return results
+
+def benchFitsOnBoard(tetrisClass, n):
+    results = {}
+    game = newGame(tetrisClass)
+    for clazz in game.tetriminos:
+        piece = clazz(game, game.rows//2, game.cols//2)
+        start = time.perf_counter()
+        for i in range(n):
+            piece.fitsOnBoard()
+        elapsed = time.perf_counter() - start
+        name = clazz.__name__.replace("Bitboard", "")
+        results["fitsOnBoard_" + name] = result(n, elapsed)
+    return results
+
+def benchGetMove(netFile, n):
+    with open(netFile, "rb") as f:
+        net = pickle.load(f)
+    boards = [newGame(Tetris, seed).boardAsArray() for seed in range(100)]
+    results = {}
+    for name, controller in (("getMove_neat", NeuralNetworkController(net)),
+            ("getMove_compiled", NeuralNetworkController(compileNetwork(net)))):
+        start = time.perf_counter()
+        for i in range(n):
+            controller.getMove(boards[i % len(boards)])
+        results[name] = result(n, time.perf_counter() - start)
+    return results
+
+def benchGeneration(configFile, evaluator=eval_genomes):
+    import neat
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+            neat.DefaultSpeciesSet, neat.DefaultStagnation, configFile)
+    random.seed(SEED)
+    population = neat.Population(config)
+    # give the networks some structure so they play more than a few ticks
+    for genome in population.population.values():
+        for i in range(20):
+            genome.mutate(config.genome_config)
+    genomes = list(population.population.items())
+    start = time.perf_counter()
+    evaluator(genomes, config)
+    elapsed = time.perf_counter() - start
+    return {"generation": result(1, elapsed, popSize=len(genomes),
+        bestFitness=max(g.fitness for i, g in genomes))}
+
+def runBenchmarks(engines, quick=False, netFile="winner.net",
+        configFile="train_config"):
+    n = 2000 if quick else 20000
+    results = {}
+    for engineName in engines:
+        tetrisClass = ENGINES[engineName]
+        for bench in (benchGameOps, benchDeleteCompleteRows, benchFitsOnBoard):
+            for name, r in bench(tetrisClass, n).items():
+                results["{}/{}".format(engineName, name)] = r
+    results.update(benchGetMove(netFile, n))
+    if not quick:
+        results.update(benchGeneration(configFile))
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "quick": quick,
+        "results": results,
+    }
+
+# prints every benchmark whose throughput changed by more than threshold
+def compare(old, new, threshold=0.1, out=sys.stdout):
+    regressions = 0
+    for name, r in sorted(new["results"].items()):
+        if name not in old["results"]:
+            continue
+        ratio = r["opsPerSecond"] / old["results"][name]["opsPerSecond"]
+        if abs(ratio - 1) > threshold:
+            regressions += ratio < 1
+            out.write("{:45s} {:6.2f}x {}\n".format(name, ratio,
+                "SLOWER" if ratio < 1 else "faster"))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engine", nargs="+", default=sorted(ENGINES),
+            choices=sorted(ENGINES))
+    parser.add_argument("--quick", action="store_true",
+            help="fewer iterations and no training generation")
+    parser.add_argument("--output", help="write the JSON results here")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    args = parser.parse_args()
+    results = runBenchmarks(args.engine, args.quick)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if compare(old, results):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
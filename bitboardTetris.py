@@ -0,0 +1,98 @@
+from tetris import Tetris
+
+# A Tetris engine that keeps every board row as an int whose bit c is set
+# when column c is occupied. Collision tests, line clears and placement are
+# done with bitwise ops on those ints. The numpy board of reps is still kept
+# up to date (it only changes when a piece is placed or rows are cleared) so
+# that rendering and anything else reading Tetris.board keeps working.
+# Given the same initrandomstate and moves it plays exactly the same game as
+# Tetris.
+class BitboardTetris(Tetris):
+
+    def tetriminoClasses(self):
+        return tuple(bitboardClass(clazz) for clazz in Tetris.tetriminoClasses(self))
+
+    def newBoard(self):
+        Tetris.newBoard(self)
+        self.bits = [0] * self.rows
+        self.fullRow = (1 << self.cols) - 1
+
+    def loadBoard(self, board, observerStates=None):
+        self.bits = [sum(1 << c for c in range(self.cols) if board[r][c])
+                for r in range(self.rows)]
+        Tetris.loadBoard(self, board, observerStates)
+
+    def rowIsComplete(self, row):
+        return row >= 0 and self.bits[row] == self.fullRow
+
+    def rowIsEmpty(self, row):
+        return row >= 0 and self.bits[row] == 0
+
+    def deleteCompleteRows(self):
+        bits = self.bits
+        fullRow = self.fullRow
+        kept = [i for i in range(self.rows) if bits[i] != fullRow]
+        deleted = self.rows - len(kept)
+        if deleted > 0:
+            deletedRows = [i for i in range(self.rows-1, -1, -1) if bits[i] == fullRow]
+            bits[:] = [0] * deleted + [bits[i] for i in kept]
+            board = self.board
+            board[deleted:] = board[kept]
+            board[:deleted] = 0
+        self.score += self.pointsFromCompleteRows(deleted)
+        if deleted > 0:
+            self.updateColumnTops()
+            for observer in self.observers:
+                observer.rowsDeleted(deletedRows)
+        return deleted
+
+    def placeFallingPiece(self):
+        fp = self.fallingPiece
+        left, right, rowMasks = fp.rowMasks[fp.maskIndex]
+        shift = fp.col + left
+        bits = self.bits
+        for dr, mask in rowMasks:
+            bits[fp.row + dr] |= mask << shift
+        Tetris.placeFallingPiece(self)
+
+# Mixed in front of a Tetrimino subclass. rowMasks[maskIndex] is
+# (left, right, ((dr, mask), ...)): left and right are the column offsets of
+# the piece's extreme cells relative to piece.col, and each mask holds the
+# cells of row piece.row+dr with bit 0 standing for column piece.col+left.
+class BitboardTetrimino:
+
+    def fitsOnBoard(self):
+        game = self.game
+        left, right, rowMasks = self.rowMasks[self.maskIndex]
+        col = self.col
+        if col + left < 0 or col + right >= game.cols:
+            return False
+        shift = col + left
+        bits = game.bits
+        rows = game.rows
+        row = self.row
+        for dr, mask in rowMasks:
+            r = row + dr
+            if not 0 <= r < rows or bits[r] & (mask << shift):
+                return False
+        return True
+
+def computeRowMasks(masks, anchors):
+    rowMasks = []
+    for mask, (ar, ac) in zip(masks, anchors):
+        left = min(c for r, c in mask) - ac
+        right = max(c for r, c in mask) - ac
+        byRow = {}
+        for r, c in mask:
+            byRow[r-ar] = byRow.get(r-ar, 0) | (1 << (c-ac-left))
+        rowMasks.append((left, right, tuple(sorted(byRow.items()))))
+    return tuple(rowMasks)
+
+bitboardClasses = {}
+
+def bitboardClass(clazz):
+    if clazz not in bitboardClasses:
+        bitboardClasses[clazz] = type("Bitboard" + clazz.__name__,
+                (BitboardTetrimino, clazz),
+                {"rowMasks": computeRowMasks(clazz.masks, clazz.anchors)})
+    return bitboardClasses[clazz]
@@ -0,0 +1,163 @@
+# The rules of breakout.Breakout without pygame: no display, no clock and
+# no mouse. step advances the game by one frame of the 60 fps window, with
+# the paddle wherever the caller puts it, so games can be simulated as fast
+# as python runs them, e.g. to train controllers. breakout.Breakout is
+# only a window that draws a BreakoutEngine.
+#   engine = BreakoutEngine()
+#   engine.run(10000, lambda engine: engine.ballX - 30)
+# Rectangles overlap as pygame.Rect.colliderect decides, so a game plays
+# exactly like in the window given the same paddle positions.
+
+# The blocks, which sit on a regular grid of pitchX by pitchY cells, as one
+# flag per cell. A rectangle can only overlap the blocks of the few cells
+# under it, so finding the block the ball hits looks at most at 4 cells
+# instead of every block. Blocks are numbered row by row, the order of the
+# list breakout.Breakout kept them in, and collide returns the first one
+# that overlaps, like pygame.Rect.collidelist did.
+class BlockGrid:
+
+    def __init__(self, left, top, cols, rows, width, height, pitchX, pitchY):
+        self.left, self.top = left, top
+        self.cols, self.rows = cols, rows
+        self.width, self.height = width, height
+        self.pitchX, self.pitchY = pitchX, pitchY
+        self.fill()
+
+    def fill(self):
+        self.present = [[True]*self.cols for row in range(self.rows)]
+        self.count = self.rows*self.cols
+
+    # (row, col) of the first block overlapping the rectangle, or None
+    def collide(self, x, y, w, h):
+        if w <= 0 or h <= 0:
+            return None
+        # block col spans left+pitchX*col up to, not including, that + width
+        pitchX, pitchY = self.pitchX, self.pitchY
+        firstCol = max(0, (x - self.left - self.width) // pitchX + 1)
+        lastCol = min(self.cols-1, (x + w - 1 - self.left) // pitchX)
+        firstRow = max(0, (y - self.top - self.height) // pitchY + 1)
+        lastRow = min(self.rows-1, (y + h - 1 - self.top) // pitchY)
+        for row in range(firstRow, lastRow+1):
+            present = self.present[row]
+            for col in range(firstCol, lastCol+1):
+                if present[col]:
+                    return row, col
+        return None
+
+    def remove(self, row, col):
+        self.present[row][col] = False
+        self.count -= 1
+
+    # (x, y, width, height) of every block left
+    def rects(self):
+        return [(self.left + self.pitchX*col, self.top + self.pitchY*row,
+                self.width, self.height)
+                for row in range(self.rows) for col in range(self.cols)
+                if self.present[row][col]]
+
+class BreakoutEngine:
+
+    WIDTH = 800
+    HEIGHT = 600
+    PADDLE_Y = 500
+    PADDLE_HEIGHT = 10
+    SEGMENT_WIDTH = 20
+    # the angle the ball leaves each paddle segment at, left to right
+    SEGMENT_ANGLES = (120, 100, 80, 45)
+    BALL_SIZE = 5
+    BALL_START_Y = 490
+    # (x, y) speed per angle and the angle after bouncing off a side wall
+    SPEEDS = {
+        120: (-10, -3),
+        100: (-10, -8),
+        80: (10, -8),
+        45: (10, -3),
+    }
+    SWAP = {
+        120: 45,
+        45: 120,
+        100: 80,
+        80: 100,
+    }
+
+    def __init__(self):
+        self.blocks = BlockGrid(50, 50, int(800 / 25 - 6), int(200 / 10), 25, 10, 27, 12)
+        self.paddleX = 300
+        self.ballX = 300
+        self.ballY = BreakoutEngine.BALL_START_Y
+        self.direction = -1
+        self.yDirection = -1
+        self.angle = 80
+        self.score = 0
+        self.frames = 0
+
+    # the x of the left end of each paddle segment
+    def segmentXs(self):
+        return [self.paddleX + BreakoutEngine.SEGMENT_WIDTH*i
+                for i in range(len(BreakoutEngine.SEGMENT_ANGLES))]
+
+    # one frame. paddleX: where to move the paddle's left end first, None to
+    # leave it
+    def step(self, paddleX=None):
+        if paddleX is not None:
+            self.paddleX = int(paddleX)
+        self.ballUpdate()
+        self.frames += 1
+
+    # paddleInput(engine): the paddleX of each frame, e.g. a controller's
+    # choice or the mouse position. None keeps the paddle where it is
+    def run(self, frames, paddleInput=None):
+        for i in range(frames):
+            if paddleInput is None:
+                self.step()
+            else:
+                self.step(paddleInput(self))
+
+    # the ball moves vertically, then horizontally, and after each half
+    # bounces off walls, the paddle and at most one block
+    def ballUpdate(self):
+        E = BreakoutEngine
+        size = E.BALL_SIZE
+        paddleY = E.PADDLE_Y
+        blocks = self.blocks
+        # below the block field no block can be hit
+        fieldBottom = blocks.top + blocks.rows*blocks.pitchY
+        for horizontal in (False, True):
+            speedX, speedY = E.SPEEDS[self.angle]
+            if horizontal:
+                self.ballX += speedX * self.direction
+            else:
+                self.ballY += speedY * self.direction * self.yDirection
+            x, y = self.ballX, self.ballY
+            if x <= 0 or x >= E.WIDTH:
+                self.angle = E.SWAP[self.angle]
+                self.ballX = x = 1 if x <= 0 else E.WIDTH - 1
+            if y <= 0:
+                self.ballY = y = 1
+                self.yDirection *= -1
+
+            if paddleY < y + size and y < paddleY + E.PADDLE_HEIGHT:
+                segmentX = self.paddleX
+                for angle in E.SEGMENT_ANGLES:
+                    if segmentX < x + size and x < segmentX + E.SEGMENT_WIDTH:
+                        self.angle = angle
+                        self.direction = -1
+                        self.yDirection = -1
+                        break
+                    segmentX += E.SEGMENT_WIDTH
+
+            if y < fieldBottom:
+                hit = blocks.collide(x, y, size, size)
+                if hit is not None:
+                    blocks.remove(*hit)
+                    if horizontal:
+                        self.direction *= -1
+                    self.yDirection *= -1
+                    self.score += 1
+            if y > E.HEIGHT:
+                # missed: a new wall and the ball back on the paddle
+                blocks.fill()
+                self.score = 0
+                self.ballX = self.paddleX + E.SEGMENT_WIDTH
+                self.ballY = E.BALL_START_Y
+                self.yDirection = self.direction = -1
@@ -0,0 +1,269 @@
+import copy
+import glob
+import gzip
+import itertools
+import os
+import pickle
+import queue
+import random
+import re
+import threading
+import traceback
+import weakref
+import neat
+
+# Checkpoints of a training run that cost the training thread almost
+# nothing. A BackgroundCheckpointer replaces neat.Checkpointer:
+#   p.add_reporter(BackgroundCheckpointer("checkpoints/neat-"))
+# and a run continues from the latest checkpoint with
+#   p = restoreCheckpoint("checkpoints/neat-", config)
+#   p.run(ResumedEvaluator(eval_genomes), 1000)
+# train.run(..., resume=True) does that.
+#
+# A checkpoint is taken right after a generation was evaluated, so it holds
+# the genomes with their fitnesses and the random state reproduction starts
+# from; resuming does not play any game again and continues exactly as the
+# run would have. Every fullInterval generations a full checkpoint
+# PREFIX<generation>.full with every genome is written. The generations in
+# between are written to PREFIX<generation>.delta files, which only hold
+# the genomes that are not in the last full checkpoint and refer to the
+# others by key. Together they form a chain, and only the latest delta of a
+# chain is kept, so resuming reads two files at most. Older chains than the
+# last keepChains are removed.
+
+# The state of a generation, taken on the training thread. neat never
+# changes a genome after creating it, only its fitness, which is copied,
+# so the genomes are shared instead of copied and the species, which
+# reproduction does change, are shallow copies holding genome keys.
+class GenerationSnapshot:
+
+    def __init__(self, generation, population, speciesSet, bestGenome, config):
+        self.generation = generation
+        self.genomes = dict(population)
+        self.fitnesses = {key: g.fitness for key, g in population.items()}
+        self.species = []
+        for s in speciesSet.species.values():
+            s = copy.copy(s)
+            for genome in s.members.values():
+                self.genomes.setdefault(genome.key, genome)
+            self.genomes.setdefault(s.representative.key, s.representative)
+            s.members = list(s.members)
+            s.representative = s.representative.key
+            s.fitness_history = list(s.fitness_history)
+            self.species.append(s)
+        self.bestGenome = bestGenome
+        self.nextSpeciesKey = peekCounter(speciesSet, "indexer")
+        self.nextNodeKey = peekCounter(config.genome_config, "node_indexer")
+        self.randomState = random.getstate()
+        self.innovationTracker = copy.deepcopy(
+                getattr(config.genome_config, "innovation_tracker", None))
+
+    # what is written: the genomes not in baseKeys, pickled one by one
+    def contents(self, baseGeneration, baseKeys):
+        return {
+            "generation": self.generation,
+            "baseGeneration": baseGeneration,
+            "genomes": {key: pickle.dumps(g, pickle.HIGHEST_PROTOCOL)
+                for key, g in self.genomes.items() if key not in baseKeys},
+            "population": list(self.fitnesses),
+            "fitnesses": self.fitnesses,
+            "species": self.species,
+            "bestGenome": self.bestGenome,
+            "nextSpeciesKey": self.nextSpeciesKey,
+            "nextNodeKey": self.nextNodeKey,
+            "randomState": self.randomState,
+            "innovationTracker": self.innovationTracker,
+        }
+
+# the next value of the itertools.count obj.name, without using it up
+def peekCounter(obj, name):
+    counter = getattr(obj, name)
+    if counter is None:
+        return None
+    value = next(counter)
+    setattr(obj, name, itertools.count(value))
+    return value
+
+def checkpointFilename(prefix, generation, kind):
+    return "{}{}.{}".format(prefix, generation, kind)
+
+# (generation, kind, filename) of every checkpoint with this prefix, oldest first
+def listCheckpoints(prefix):
+    pattern = re.compile(re.escape(os.path.basename(prefix)) + r"(\d+)\.(full|delta)$")
+    found = []
+    for filename in glob.glob(glob.escape(prefix) + "*"):
+        match = pattern.match(os.path.basename(filename))
+        if match:
+            found.append((int(match.group(1)), match.group(2), filename))
+    return sorted(found)
+
+# Writes a checkpoint of every generation from a background thread. If
+# writing falls more than maxPending generations behind, the training
+# thread waits for it. Call close, or let python exit, to write the
+# checkpoints still pending.
+class BackgroundCheckpointer(neat.reporting.BaseReporter):
+
+    def __init__(self, prefix="neat-checkpoint-", fullInterval=10, keepChains=2,
+            compression=5, maxPending=2):
+        self.prefix = prefix
+        self.fullInterval = fullInterval
+        self.keepChains = keepChains
+        self.compression = compression
+        self.generation = None
+        self.bestGenome = None
+        # the generation and genome keys of the last full checkpoint
+        self.baseGeneration = None
+        self.baseKeys = frozenset()
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.pending = queue.Queue(maxPending)
+        self.writer = threading.Thread(target=self.writeCheckpoints, daemon=True)
+        self.writer.start()
+        self.closeAtExit = weakref.finalize(self, BackgroundCheckpointer.stopWriter,
+                self.pending, self.writer)
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        if self.bestGenome is None or best_genome.fitness > self.bestGenome.fitness:
+            self.bestGenome = best_genome
+        snapshot = GenerationSnapshot(self.generation, population, species,
+                self.bestGenome, config)
+        if (self.baseGeneration is None
+                or self.generation - self.baseGeneration >= self.fullInterval):
+            self.baseGeneration = self.generation
+            self.baseKeys = frozenset(snapshot.genomes)
+            self.pending.put((snapshot, None, frozenset()))
+        else:
+            self.pending.put((snapshot, self.baseGeneration, self.baseKeys))
+
+    def writeCheckpoints(self):
+        while True:
+            item = self.pending.get()
+            try:
+                if item is None:
+                    return
+                self.write(*item)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self.pending.task_done()
+
+    def write(self, snapshot, baseGeneration, baseKeys):
+        kind = "full" if baseGeneration is None else "delta"
+        filename = checkpointFilename(self.prefix, snapshot.generation, kind)
+        contents = snapshot.contents(baseGeneration, baseKeys)
+        # a crash while writing leaves the previous checkpoints intact
+        with gzip.open(filename + ".tmp", "wb", compresslevel=self.compression) as f:
+            pickle.dump(contents, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(filename + ".tmp", filename)
+        self.removeOldCheckpoints()
+
+    # keeps the last keepChains chains, and only the latest delta of each.
+    # a full checkpoint replaces a delta of the same generation
+    def removeOldCheckpoints(self):
+        checkpoints = listCheckpoints(self.prefix)
+        fulls = [generation for generation, kind, filename in checkpoints
+                if kind == "full"]
+        keptFulls = fulls[-self.keepChains:]
+        chains = {}
+        for generation, kind, filename in checkpoints:
+            chains[filename] = max([full for full in fulls if full <= generation],
+                    default=None)
+        latestDeltas = {chains[filename]: generation
+                for generation, kind, filename in checkpoints if kind == "delta"}
+        for generation, kind, filename in checkpoints:
+            chain = chains[filename]
+            if chain not in keptFulls or (kind == "delta"
+                    and (generation != latestDeltas[chain] or generation == chain)):
+                os.remove(filename)
+
+    # waits until every pending checkpoint is written
+    def flush(self):
+        self.pending.join()
+
+    def close(self):
+        self.closeAtExit()
+
+    @staticmethod
+    def stopWriter(pending, writer):
+        pending.put(None)
+        writer.join()
+
+# the files to restore the latest generation from: the full checkpoint and
+# the delta to apply to it or None. None if there are no checkpoints
+def latestCheckpoint(prefix):
+    checkpoints = listCheckpoints(prefix)
+    if not checkpoints:
+        return None
+    generation, kind, filename = checkpoints[-1]
+    if kind == "full":
+        return filename, None
+    with gzip.open(filename, "rb") as f:
+        delta = pickle.load(f)
+    return checkpointFilename(prefix, delta["baseGeneration"], "full"), filename
+
+def loadCheckpoint(filename):
+    with gzip.open(filename, "rb") as f:
+        return pickle.load(f)
+
+# A neat.Population in the state of the latest checkpoint with this prefix,
+# with every genome's fitness set. Run it with a ResumedEvaluator.
+# checkpointer: the BackgroundCheckpointer that continues the checkpoints
+def restoreCheckpoint(prefix, config, checkpointer=None):
+    files = latestCheckpoint(prefix)
+    if files is None:
+        raise ValueError("no checkpoints found for " + prefix)
+    fullFile, deltaFile = files
+    state = loadCheckpoint(fullFile)
+    storedGenomes = state["genomes"]
+    if deltaFile is not None:
+        state = loadCheckpoint(deltaFile)
+        storedGenomes.update(state["genomes"])
+    genomes = {key: pickle.loads(storedGenomes[key]) for key in
+            set(state["population"]).union(*[s.members for s in state["species"]],
+                [s.representative for s in state["species"]])}
+    for key, fitness in state["fitnesses"].items():
+        genomes[key].fitness = fitness
+    population = {key: genomes[key] for key in state["population"]}
+
+    speciesSet = config.species_set_type(config.species_set_config, None)
+    for s in state["species"]:
+        s.members = {key: genomes[key] for key in s.members}
+        s.representative = genomes[s.representative]
+        speciesSet.species[s.key] = s
+        for key in s.members:
+            speciesSet.genome_to_species[key] = s.key
+    speciesSet.indexer = itertools.count(state["nextSpeciesKey"])
+
+    p = neat.Population(config, (population, speciesSet, state["generation"]))
+    random.setstate(state["randomState"])
+    tracker = state["innovationTracker"]
+    if tracker is not None:
+        p.reproduction.innovation_tracker = tracker
+        config.genome_config.innovation_tracker = tracker
+    if state["nextNodeKey"] is not None:
+        config.genome_config.node_indexer = itertools.count(state["nextNodeKey"])
+    if hasattr(p.reproduction, "genome_indexer"):
+        p.reproduction.genome_indexer = itertools.count(max(genomes) + 1)
+    p.best_genome = state["bestGenome"]
+    if checkpointer is not None:
+        checkpointer.bestGenome = state["bestGenome"]
+    return p
+
+# Wraps an evaluator like eval_genomes for Population.run on a restored
+# population: the first generation's fitnesses are already known, so
+# nothing is played for it.
+class ResumedEvaluator:
+
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+        self.resumed = False
+
+    def __call__(self, genomes, config):
+        resumed, self.resumed = self.resumed, True
+        if not resumed and all(g.fitness is not None for genome_id, g in genomes):
+            return
+        self.evaluator(genomes, config)
@@ -0,0 +1,122 @@
+import numpy as np
+import neat
+
+def sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(5.0*z, -60.0, 60.0)))
+
+def tanh(z):
+    return np.tanh(np.clip(2.5*z, -60.0, 60.0))
+
+def relu(z):
+    return np.maximum(z, 0.0)
+
+def identity(z):
+    return z
+
+def clamped(z):
+    return np.clip(z, -1.0, 1.0)
+
+# numpy versions of neat's activation functions, any other activation is
+# applied elementwise with np.vectorize
+ACTIVATIONS = {
+    neat.activations.sigmoid_activation: sigmoid,
+    neat.activations.tanh_activation: tanh,
+    neat.activations.relu_activation: relu,
+    neat.activations.identity_activation: identity,
+    neat.activations.clamped_activation: clamped,
+}
+
+def numpyActivation(actFunc):
+    if actFunc in ACTIVATIONS:
+        return ACTIVATIONS[actFunc]
+    return np.vectorize(actFunc, otypes=[float])
+
+# A neat.nn.FeedForwardNetwork turned into matrices. Nodes are grouped into
+# layers so that a node only depends on the inputs and on nodes of earlier
+# layers. All input connections form one (numInputs, numNodes) matrix, and
+# each layer has a matrix of the connections coming from earlier layers,
+# so evaluating the network is one matmul for the inputs plus one per
+# layer, for a single board or a whole batch of them.
+class CompiledNetwork:
+
+    def __init__(self, net):
+        inputIndex = {key: i for i, key in enumerate(net.input_nodes)}
+        depth = {}
+        for node, actFunc, aggFunc, bias, response, links in net.node_evals:
+            if aggFunc is not neat.aggregations.sum_aggregation:
+                raise ValueError("only sum aggregation can be compiled, node {} uses {}"
+                        .format(node, aggFunc.__name__))
+            depth[node] = 1 + max([depth[i] for i, w in links if i in depth],
+                    default=0)
+        evals = sorted(net.node_evals, key=lambda e: depth[e[0]])
+        nodeIndex = {e[0]: j for j, e in enumerate(evals)}
+        numNodes = len(evals)
+
+        self.numInputs = len(net.input_nodes)
+        self.inputWeights = np.zeros((self.numInputs, numNodes))
+        self.bias = np.array([e[3] for e in evals], dtype=float)
+        self.response = np.array([e[4] for e in evals], dtype=float)
+        hiddenWeights = np.zeros((numNodes, numNodes))
+        for j, (node, actFunc, aggFunc, bias, response, links) in enumerate(evals):
+            for i, w in links:
+                if i in inputIndex:
+                    self.inputWeights[inputIndex[i], j] += w
+                else:
+                    hiddenWeights[nodeIndex[i], j] += w
+
+        # layers: (start, end, weights from nodes [0, start) or None,
+        #   [(activation, columns of the layer it applies to), ...])
+        self.layers = []
+        start = 0
+        while start < numNodes:
+            end = start
+            while end < numNodes and depth[evals[end][0]] == depth[evals[start][0]]:
+                end += 1
+            weights = hiddenWeights[:start, start:end]
+            if not weights.any():
+                weights = None
+            groups = {}
+            for j in range(start, end):
+                groups.setdefault(evals[j][1], []).append(j-start)
+            activations = []
+            for actFunc, columns in groups.items():
+                if len(columns) == end-start:
+                    columns = slice(None)
+                activations.append((numpyActivation(actFunc), columns))
+            self.layers.append((start, end, weights, activations))
+            start = end
+
+        # outputs the network never evaluates keep activate's initial 0.0
+        self.outputIndex = np.array([nodeIndex.get(key, numNodes)
+            for key in net.output_nodes])
+
+    # inputs: (N, numInputs) array of N boards. returns (N, numOutputs)
+    def activateBatch(self, inputs):
+        inputs = np.asarray(inputs, dtype=float)
+        return self.evaluate(inputs @ self.inputWeights)
+
+    # same as neat.nn.FeedForwardNetwork.activate for one board
+    def activate(self, inputs):
+        return self.activateBatch(np.asarray(inputs)[None, :])[0]
+
+    # same as activate for a 0/1 board given by the indices of its 1s, the
+    # cost of the input layer then grows with len(activeInputs) only
+    def activateSparse(self, activeInputs):
+        return self.evaluate(self.inputWeights[activeInputs].sum(axis=0)[None, :])[0]
+
+    # inputSums: (N, numNodes) sums of the weighted inputs of every node
+    def evaluate(self, inputSums):
+        n = len(inputSums)
+        values = np.zeros((n, len(self.bias)+1))
+        for start, end, weights, activations in self.layers:
+            z = inputSums[:, start:end]
+            if weights is not None:
+                z = z + values[:, :start] @ weights
+            z = self.bias[start:end] + self.response[start:end]*z
+            layerValues = values[:, start:end]
+            for activation, columns in activations:
+                layerValues[:, columns] = activation(z[:, columns])
+        return values[:, self.outputIndex]
+
+def compileNetwork(net):
+    return CompiledNetwork(net)
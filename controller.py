@@ -1,3 +1,5 @@
+import numpy as np
+
 class Controller():
 
     # returns: one of Tetris.LEFT, Tetris.RIGHT, Tetris.DOWN, Tetris.DROP,
@@ -5,3 +7,50 @@ class Controller():
     # board: a numpy array representing the current board
     def getMove(self, board):
         raise Exception("Abstract function not implemented")
+
+class SparseController(Controller):
+
+    # same as getMove, but only given the indices of the nonzero entries of
+    # the board array. AutomatedTetris uses this instead of getMove
+    def getMoveSparse(self, activeIndices):
+        raise Exception("Abstract function not implemented")
+
+class FeatureController(Controller):
+
+    # same as getMove, but given the engineered features of
+    # features.BoardFeatures instead of the board array. AutomatedTetris
+    # uses this instead of getMove
+    def getMoveFeatures(self, features):
+        raise Exception("Abstract function not implemented")
+
+class PlacementController(Controller):
+
+    # returns: one of placements, where the falling piece will be put down
+    # placements: the tetris.Placement list from Tetris.placements()
+    def getPlacement(self, placements):
+        raise Exception("Abstract function not implemented")
+
+class BatchController():
+
+    # returns: an array with one move per row of boards, see Controller
+    # boards: an (N, features) numpy array, the board arrays of N games
+    def getMoves(self, boards):
+        raise Exception("Abstract function not implemented")
+
+# asks a Controller for the move of each game in turn
+class PerGameBatchController(BatchController):
+
+    def __init__(self, controller):
+        self.controller = controller
+
+    def getMoves(self, boards):
+        return np.array([self.controller.getMove(board) for board in boards], dtype=int)
+
+# asks a BatchController for the move of one game, in a batch of one
+class SingleGameController(Controller):
+
+    def __init__(self, batchController):
+        self.batchController = batchController
+
+    def getMove(self, board):
+        return int(self.batchController.getMoves(np.asarray(board)[None, :])[0])
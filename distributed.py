@@ -0,0 +1,290 @@
+from collections import deque
+from multiprocessing.connection import Client, Listener, AuthenticationError, \
+        answer_challenge, deliver_challenge
+from parallelEval import playTrial, MAX_MOVES
+from train import TRIALS_PER_GENOME
+import itertools
+import numpy as np
+import os
+import pickle
+import socket
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+# Evaluates genomes on worker processes on any number of machines. The
+# coordinator, a DistributedEvaluator, is passed to neat.Population.run
+# like eval_genomes and hands out batches of (genome, trial) tasks over TCP.
+# Workers connect whenever they like, play the batches with AutomatedTetris
+# and send the scores back:
+#   export TETRIS_WORKER_KEY=<a long random secret>     # everywhere
+#   p.run(DistributedEvaluator(host="0.0.0.0", port=5555), 1000)
+#   python distributed.py worker COORDINATOR_HOST 5555     # on every machine
+# The coordinator only listens on 127.0.0.1 unless given another host.
+# Messages are pickles, which run code when loaded, so both ends first
+# prove they know the shared key with the HMAC challenge of
+# multiprocessing.connection and nothing is unpickled before that. Without
+# TETRIS_WORKER_KEY or authkey the coordinator makes up a key, which only
+# its spawnLocalWorkers know, so using other machines needs the key set.
+# The key keeps strangers out but the traffic is not encrypted.
+#
+# Every message is a multiprocessing.connection message holding a zlib
+# compressed pickle of a tuple whose first item says what it is:
+#   worker -> coordinator  ("hello", hostname, pid)
+#                          ("request",)
+#                          ("results", batchId, [(task, score)])
+#   coordinator -> worker  ("batch", batchId, configId, config or None if
+#                               the worker already has it, maxMoves,
+#                               [(task, genome, trial)])
+#                          ("stop",)
+
+COMPRESSION = 6
+AUTHKEY_ENV = "TETRIS_WORKER_KEY"
+
+# the shared key: authkey, else TETRIS_WORKER_KEY, else None
+def workerKey(authkey=None):
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_ENV)
+    if isinstance(authkey, str):
+        authkey = authkey.encode()
+    return authkey or None
+
+def sendMessage(conn, message):
+    conn.send_bytes(zlib.compress(pickle.dumps(message, pickle.HIGHEST_PROTOCOL),
+        COMPRESSION))
+
+# the next message, or None once the other side has gone
+def recvMessage(conn):
+    try:
+        data = conn.recv_bytes()
+    except EOFError:
+        return None
+    return pickle.loads(zlib.decompress(data))
+
+# The coordinator. Each generation is split into batches of batchSize
+# tasks. A batch goes back into the queue when the worker playing it
+# disconnects, and is handed out again to the next free worker once it has
+# been out for timeout seconds; whichever copy finishes first counts.
+# Workers that join mid-generation simply start asking for batches.
+# host: the interface to listen on, "0.0.0.0" for workers on other machines
+# port=0 picks a free port, see address.
+# authkey: the key workers must know, a string or its utf-8 bytes, see
+#   workerKey
+class DistributedEvaluator:
+
+    def __init__(self, host="127.0.0.1", port=0, batchSize=4, trials=TRIALS_PER_GENOME,
+            maxMoves=MAX_MOVES, timeout=120.0, verbose=False, authkey=None):
+        self.batchSize = batchSize
+        self.trials = trials
+        self.maxMoves = maxMoves
+        self.timeout = timeout
+        self.verbose = verbose
+        self.lock = threading.Condition()
+        self.batchIds = itertools.count()
+        # batchId: tasks, for the batches of this generation not done yet
+        self.batches = {}
+        self.pending = deque()
+        # batchId: when it may be handed out again
+        self.deadlines = {}
+        # workerId: the batchIds it is playing
+        self.workers = {}
+        self.scores = {}
+        self.config = None
+        self.configId = 0
+        self.closed = False
+        self.authkey = workerKey(authkey) or os.urandom(32).hex().encode()
+        # the handshake is done by each worker's thread, so a peer that
+        # never answers cannot hold up the others
+        self.listener = Listener((host, port))
+        self.address = self.listener.address[:2]
+        threading.Thread(target=self.acceptWorkers, daemon=True).start()
+
+    def log(self, text):
+        if self.verbose:
+            print(" ", text)
+
+    def acceptWorkers(self):
+        for workerId in itertools.count():
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.serveWorker, args=(workerId, conn),
+                    daemon=True).start()
+
+    # the challenges Listener.accept would make, both ways
+    def authenticate(self, workerId, conn):
+        try:
+            deliver_challenge(conn, self.authkey)
+            answer_challenge(conn, self.authkey)
+            return True
+        except (AuthenticationError, OSError, EOFError):
+            self.log("worker {} failed the handshake".format(workerId))
+            conn.close()
+            return False
+
+    def serveWorker(self, workerId, conn):
+        if not self.authenticate(workerId, conn):
+            return
+        with self.lock:
+            self.workers[workerId] = set()
+        sentConfigId = None
+        try:
+            while True:
+                message = recvMessage(conn)
+                if message is None:
+                    break
+                if message[0] == "hello":
+                    self.log("worker {} joined: {} pid {}".format(workerId, *message[1:]))
+                elif message[0] == "request":
+                    batch = self.nextBatch(workerId)
+                    if batch is None:
+                        sendMessage(conn, ("stop",))
+                        break
+                    batchId, tasks, configId, config = batch
+                    if configId == sentConfigId:
+                        config = None
+                    sendMessage(conn, ("batch", batchId, configId, config,
+                        self.maxMoves, tasks))
+                    sentConfigId = configId
+                elif message[0] == "results":
+                    self.complete(workerId, message[1], message[2])
+        except (OSError, EOFError, zlib.error, pickle.UnpicklingError):
+            pass
+        finally:
+            conn.close()
+            self.workerLeft(workerId)
+
+    # waits for a batch to hand to workerId, None once closed
+    def nextBatch(self, workerId):
+        with self.lock:
+            while not self.closed:
+                batchId = self.nextBatchId()
+                if batchId is not None:
+                    self.deadlines[batchId] = time.monotonic() + self.timeout
+                    self.workers[workerId].add(batchId)
+                    return batchId, self.batches[batchId], self.configId, self.config
+                self.lock.wait(1.0)
+            return None
+
+    def nextBatchId(self):
+        while self.pending:
+            batchId = self.pending.popleft()
+            if batchId in self.batches:
+                return batchId
+        now = time.monotonic()
+        overdue = [(deadline, batchId) for batchId, deadline in self.deadlines.items()
+                if deadline < now and batchId in self.batches]
+        if overdue:
+            batchId = min(overdue)[1]
+            self.log("batch {} timed out, handing it out again".format(batchId))
+            return batchId
+        return None
+
+    def complete(self, workerId, batchId, scores):
+        with self.lock:
+            self.workers[workerId].discard(batchId)
+            if batchId not in self.batches:
+                # a copy of a batch that timed out, or of an old generation
+                return
+            self.scores.update(scores)
+            del self.batches[batchId]
+            self.deadlines.pop(batchId, None)
+            if not self.batches:
+                self.lock.notify_all()
+
+    def workerLeft(self, workerId):
+        with self.lock:
+            batchIds = self.workers.pop(workerId, set())
+            stillPlayed = set().union(*self.workers.values())
+            for batchId in batchIds:
+                if batchId in self.batches and batchId not in stillPlayed:
+                    self.deadlines.pop(batchId, None)
+                    self.pending.appendleft(batchId)
+            self.log("worker {} left".format(workerId))
+            self.lock.notify_all()
+
+    def __call__(self, genomes, config):
+        tasks = [(index*self.trials + trial, genome, trial)
+                for index, (genome_id, genome) in enumerate(genomes)
+                for trial in range(self.trials)]
+        with self.lock:
+            if config is not self.config:
+                self.config = config
+                self.configId += 1
+            self.scores = {}
+            for start in range(0, len(tasks), self.batchSize):
+                batchId = next(self.batchIds)
+                self.batches[batchId] = tasks[start:start+self.batchSize]
+                self.pending.append(batchId)
+            self.lock.notify_all()
+            while self.batches:
+                self.lock.wait()
+            scores = np.array([self.scores[task] for task, genome, trial in tasks])
+        scores = scores.reshape(len(genomes), self.trials)
+        for (genome_id, genome), genomeScores in zip(genomes, scores):
+            genome.fitness = np.mean(genomeScores)
+
+    # tells the workers to stop and stops accepting new ones
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.lock.notify_all()
+        self.listener.close()
+
+# raises AuthenticationError if the coordinator has another key
+def connect(host, port, authkey, retrySeconds):
+    deadline = time.monotonic() + retrySeconds
+    while True:
+        try:
+            return Client((host, port), authkey=authkey)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+# a worker: plays batches until the coordinator stops it or goes away
+# authkey: the coordinator's key, see workerKey
+def runWorker(host, port, retrySeconds=30.0, authkey=None):
+    authkey = workerKey(authkey)
+    if authkey is None:
+        raise ValueError("no key to connect with, set " + AUTHKEY_ENV)
+    conn = connect(host, port, authkey, retrySeconds)
+    sendMessage(conn, ("hello", socket.gethostname(), os.getpid()))
+    config = None
+    try:
+        while True:
+            sendMessage(conn, ("request",))
+            message = recvMessage(conn)
+            if message is None or message[0] == "stop":
+                break
+            _, batchId, configId, newConfig, maxMoves, tasks = message
+            if newConfig is not None:
+                config = newConfig
+            scores = [(task, playTrial(genome, config, trial, maxMoves)[0])
+                    for task, genome, trial in tasks]
+            sendMessage(conn, ("results", batchId, scores))
+    except OSError:
+        pass
+    finally:
+        conn.close()
+
+# starts n worker processes on this machine, e.g. one per core, for the
+# DistributedEvaluator evaluator. the key goes through the environment,
+# which other users cannot read, not the command line
+def spawnLocalWorkers(n, evaluator):
+    host, port = evaluator.address
+    if host in ("", "0.0.0.0", "::"):
+        host = "localhost"
+    env = dict(os.environ)
+    env[AUTHKEY_ENV] = evaluator.authkey.decode()
+    return [subprocess.Popen([sys.executable, os.path.abspath(__file__),
+        "worker", host, str(port)], env=env) for i in range(n)]
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "worker":
+        print("usage: python distributed.py worker HOST PORT, with the key in " + AUTHKEY_ENV)
+        sys.exit(2)
+    runWorker(sys.argv[2], int(sys.argv[3]))
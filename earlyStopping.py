@@ -0,0 +1,119 @@
+from collections import deque
+
+# Decides after every tick of AutomatedTetris.play whether the game is
+# hopeless and can be ended early. A policy is reused for many games:
+# start is called at the beginning of each one. ticksSaved counts the ticks
+# between a stop and maxMoves, which is how many ticks at most the game
+# would still have been played.
+class EarlyStopPolicy:
+
+    def __init__(self):
+        self.ticksSaved = 0
+        self.gamesStopped = 0
+
+    def start(self, autoTetris, maxMoves):
+        pass
+
+    def shouldStop(self, autoTetris):
+        return False
+
+    def stopped(self, ticksSaved):
+        self.ticksSaved += ticksSaved
+        self.gamesStopped += 1
+
+    # called by the evaluator before each generation with the best score of
+    # the generation before it, 0 for the first
+    def newGeneration(self, bestScore):
+        pass
+
+    def report(self):
+        return "{}: stopped {} games, saved {} ticks".format(
+                type(self).__name__, self.gamesStopped, self.ticksSaved)
+
+# Stops games where the controller keeps going back to states it has
+# already been in, e.g. by spinning ROTATE or stepping LEFT-RIGHT while
+# gravity does all the work. A state is the hash of the board together with
+# the falling piece's rotation and position. The game stops once at least
+# maxRepeatFraction of the last window ticks were repeats. Spinning ROTATE
+# only repeats on about 6 of every 10 ticks, since the row changes on each
+# gravity tick and the first rotations after it are new, so the default
+# stays below that.
+class StallDetector(EarlyStopPolicy):
+
+    def __init__(self, window=100, maxRepeatFraction=0.5):
+        EarlyStopPolicy.__init__(self)
+        self.window = window
+        self.maxRepeats = maxRepeatFraction * window
+
+    def start(self, autoTetris, maxMoves):
+        self.repeats = deque(maxlen=self.window)
+        self.repeatCount = 0
+        self.piecesPlaced = -1
+
+    def shouldStop(self, autoTetris):
+        tetris = autoTetris.tetris
+        if tetris.piecesPlaced != self.piecesPlaced:
+            self.piecesPlaced = tetris.piecesPlaced
+            self.boardHash = hash(tetris.board.tobytes())
+            self.seen = set()
+        fp = tetris.fallingPiece
+        state = hash((self.boardHash, fp.maskIndex, fp.row, fp.col))
+        repeat = state in self.seen
+        self.seen.add(state)
+        if len(self.repeats) == self.window:
+            self.repeatCount -= self.repeats[0]
+        self.repeats.append(repeat)
+        self.repeatCount += repeat
+        return len(self.repeats) == self.window and self.repeatCount >= self.maxRepeats
+
+# Stops games whose score has not changed within the last maxPieces pieces.
+class NoScoreChange(EarlyStopPolicy):
+
+    def __init__(self, maxPieces=50):
+        EarlyStopPolicy.__init__(self)
+        self.maxPieces = maxPieces
+
+    def start(self, autoTetris, maxMoves):
+        self.lastScore = autoTetris.score()
+        self.lastChange = autoTetris.tetris.piecesPlaced
+
+    def shouldStop(self, autoTetris):
+        tetris = autoTetris.tetris
+        if tetris.score != self.lastScore:
+            self.lastScore = tetris.score
+            self.lastChange = tetris.piecesPlaced
+        return tetris.piecesPlaced - self.lastChange >= self.maxPieces
+
+# Stops games that can no longer reach the best score of the previous
+# generation, even if every remaining tick dropped a piece and every
+# completed line came as part of a tetris. Not the best score of the whole
+# run: one lucky record would then stop most games of every later
+# generation, and their genomes would be ranked by partial scores. Only
+# checked once per placed piece, since the bound only shrinks slowly.
+class ScoreBound(EarlyStopPolicy):
+
+    def __init__(self, target=0):
+        EarlyStopPolicy.__init__(self)
+        self.target = target
+
+    def newGeneration(self, bestScore):
+        self.target = bestScore
+
+    def start(self, autoTetris, maxMoves):
+        self.maxMoves = maxMoves
+        self.piecesPlaced = -1
+
+    def maxScoreGain(self, tetris, ticksLeft):
+        pieces = ticksLeft + 1
+        cells = tetris.board.astype(bool).sum() + 4*pieces
+        lines = cells // tetris.cols
+        return (lines // 4) * tetris.pointsFromCompleteRows(4) + \
+                tetris.pointsFromCompleteRows(lines % 4)
+
+    def shouldStop(self, autoTetris):
+        tetris = autoTetris.tetris
+        if self.maxMoves < 0 or tetris.piecesPlaced == self.piecesPlaced:
+            return False
+        self.piecesPlaced = tetris.piecesPlaced
+        ticksLeft = self.maxMoves - autoTetris.gameLength
+        return tetris.score + self.maxScoreGain(tetris, ticksLeft) < self.target
@@ -0,0 +1,149 @@
+from tetris import TetrisObserver
+import numpy as np
+
+# the number of values BoardFeatures.asArray has for a board of cols columns
+def numFeatures(cols, numPieces=7):
+    return cols + 5 + 2*numPieces + 3
+
+# A small observation of a Tetris game for networks, instead of the
+# rows*cols cells of boardAsArray: 32 values for the default board.
+#   heights   cols values, the height of each column
+#   holes     the empty cells under the columns' tops, summed over columns
+#   bumpiness the sum of the height differences of neighbouring columns
+#   rowTransitions  how often a row changes between empty and occupied,
+#             summed over all rows, the walls counting as occupied
+#   wells     the summed depths of the columns lower than both neighbours
+#   lines     the rows the last placed piece cleared
+#   current   one-hot of the falling piece, index in tetris.tetriminos
+#   next      one-hot of the piece after it
+#   position  the falling piece's row, column and rotation
+# Counts are divided by rows, lines by 4 and the position by the board's
+# size or the 4 rotations, so all of them stay around 0..1.
+#
+# Like SparseBoardObservation it is kept up to date as an observer: a
+# placed piece updates the counts of the columns and rows it touched, a
+# line clear shifts the rows, and only a loaded board is scanned again.
+# The falling piece's values are read when the array is asked for, and the
+# next piece is only looked up once per piece.
+#   features = BoardFeatures(tetris)
+#   net.activate(features.asArray())
+class BoardFeatures(TetrisObserver):
+
+    def __init__(self, tetris):
+        self.tetris = tetris
+        rows, cols = tetris.rows, tetris.cols
+        numPieces = tetris.numTetriminos
+        self.size = numFeatures(cols, numPieces)
+        self.HEIGHTS = 0
+        self.HOLES = cols
+        self.BUMPINESS = cols + 1
+        self.ROW_TRANSITIONS = self.BUMPINESS + 1
+        self.WELLS = self.BUMPINESS + 2
+        self.LINES = self.BUMPINESS + 3
+        self.CURRENT = self.BUMPINESS + 4
+        self.NEXT = self.CURRENT + numPieces
+        self.POSITION = self.NEXT + numPieces
+        self.array = np.zeros(self.size)
+        self.boardLoaded()
+        tetris.addObserver(self)
+
+    def boardLoaded(self):
+        tetris = self.tetris
+        rows, cols = tetris.rows, tetris.cols
+        occupied = tetris.board != 0
+        self.counts = occupied.sum(axis=0).tolist()
+        self.heights = [0]*cols
+        self.holes = [0]*cols
+        self.bumps = [0]*(cols-1)
+        self.wellDepths = [0]*cols
+        self.totalHoles = 0
+        self.bumpiness = 0
+        self.wells = 0
+        self.transitions = [self.rowTransitions(r) for r in range(rows)]
+        self.array[self.LINES] = 0
+        self.updateColumns(range(cols))
+        self.array[self.ROW_TRANSITIONS] = sum(self.transitions) / rows
+        # the falling piece may be another one now
+        self.piecesPlaced = None
+
+    def piecePlaced(self, cells):
+        counts = self.counts
+        rows = set()
+        columns = set()
+        for r, c in cells:
+            counts[c] += 1
+            rows.add(r)
+            columns.add(c)
+        transitions = self.transitions
+        for r in rows:
+            transitions[r] = self.rowTransitions(r)
+        self.array[self.ROW_TRANSITIONS] = sum(transitions) / self.tetris.rows
+        self.array[self.LINES] = 0
+        self.updateColumns(columns)
+
+    # the deleted rows were full, so every column lost one cell per row and
+    # had no transitions there; the rows above move down and empty rows,
+    # with a transition at each wall, come in at the top
+    def rowsDeleted(self, rows):
+        deleted = set(rows)
+        self.counts = [count - len(rows) for count in self.counts]
+        self.transitions = [2]*len(rows) + [t for r, t in enumerate(self.transitions)
+                if r not in deleted]
+        self.array[self.ROW_TRANSITIONS] = sum(self.transitions) / self.tetris.rows
+        self.array[self.LINES] = len(rows) / 4
+        self.updateColumns(range(self.tetris.cols))
+
+    def rowTransitions(self, r):
+        row = np.concatenate(([True], self.tetris.board[r] != 0, [True]))
+        return int(np.count_nonzero(row[1:] != row[:-1]))
+
+    # recomputes the column values of columns and the bumps and wells next
+    # to them from tetris.columnTops
+    def updateColumns(self, columns):
+        tetris = self.tetris
+        rows, cols = tetris.rows, tetris.cols
+        columnTops = tetris.columnTops
+        heights, holes = self.heights, self.holes
+        array = self.array
+        neighbours = set()
+        for c in columns:
+            height = rows - columnTops[c]
+            heights[c] = height
+            self.totalHoles += height - self.counts[c] - holes[c]
+            holes[c] = height - self.counts[c]
+            array[self.HEIGHTS+c] = height / rows
+            neighbours.update((c-1, c, c+1))
+        bumps, wellDepths = self.bumps, self.wellDepths
+        for c in neighbours:
+            if 0 <= c < cols-1:
+                bump = abs(heights[c] - heights[c+1])
+                self.bumpiness += bump - bumps[c]
+                bumps[c] = bump
+            if 0 <= c < cols:
+                left = heights[c-1] if c > 0 else rows
+                right = heights[c+1] if c < cols-1 else rows
+                depth = max(0, min(left, right) - heights[c])
+                self.wells += depth - wellDepths[c]
+                wellDepths[c] = depth
+        array[self.HOLES] = self.totalHoles / rows
+        array[self.BUMPINESS] = self.bumpiness / rows
+        array[self.WELLS] = self.wells / rows
+
+    def updatePiece(self):
+        tetris = self.tetris
+        fp = tetris.fallingPiece
+        array = self.array
+        if tetris.piecesPlaced != self.piecesPlaced:
+            self.piecesPlaced = tetris.piecesPlaced
+            array[self.CURRENT:self.POSITION] = 0
+            array[self.CURRENT + tetris.pieceIndex[type(fp)]] = 1
+            array[self.NEXT + tetris.nextPieceIndex()] = 1
+        array[self.POSITION] = fp.row / tetris.rows
+        array[self.POSITION+1] = fp.col / tetris.cols
+        array[self.POSITION+2] = fp.maskIndex / 4
+
+    # the features of the game as it is now, shared between calls so it
+    # must not be modified
+    def asArray(self):
+        self.updatePiece()
+        return self.array
@@ -0,0 +1,66 @@
+import hashlib
+import shelve
+from collections import OrderedDict
+
+# a hash of everything about a genome that changes the network it builds:
+# the enabled connections with their weights and the nodes with their
+# biases, responses, activations and aggregations
+def genomeHash(genome):
+    connections = sorted((key, cg.weight)
+            for key, cg in genome.connections.items() if cg.enabled)
+    nodes = sorted((key, ng.bias, ng.response, ng.activation, ng.aggregation)
+            for key, ng in genome.nodes.items())
+    return hashlib.sha1(repr((connections, nodes)).encode()).hexdigest()
+
+# Remembers the score of every (network, trial, maxMoves) that was played so
+# no network is ever simulated twice. The most recently used maxSize scores
+# are kept in memory. With a filename every score is also written to a
+# shelve file, which is read back on a restart, e.g. after resuming from a
+# neat.Checkpointer checkpoint.
+class FitnessCache:
+
+    def __init__(self, maxSize=100000, filename=None):
+        self.maxSize = maxSize
+        self.scores = OrderedDict()
+        self.store = None
+        if filename != None:
+            self.store = shelve.open(filename)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, genome, trial, maxMoves):
+        return "{}:{}:{}".format(genomeHash(genome), trial, maxMoves)
+
+    # returns the cached score or None
+    def get(self, key):
+        if key in self.scores:
+            self.scores.move_to_end(key)
+            self.hits += 1
+            return self.scores[key]
+        if self.store is not None and key in self.store:
+            self.hits += 1
+            score = self.store[key]
+            self.remember(key, score)
+            return score
+        self.misses += 1
+        return None
+
+    def put(self, key, score):
+        self.remember(key, score)
+        if self.store is not None:
+            self.store[key] = score
+
+    def remember(self, key, score):
+        self.scores[key] = score
+        self.scores.move_to_end(key)
+        while len(self.scores) > self.maxSize:
+            self.scores.popitem(last=False)
+
+    def sync(self):
+        if self.store is not None:
+            self.store.sync()
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
@@ -0,0 +1,208 @@
+import neat
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from tetris import Tetris
+from automatedTetris import AutomatedTetris
+
+# Where the time of a training run goes. Nothing here costs anything until
+# enable() is called: eval_genomes and parallelEval only check once per game
+# whether to play it with an InstrumentedAutomatedTetris.
+#   p.add_reporter(PhaseReporter())        # also calls enable()
+#   with StackSampler("train.stacks"):
+#       p.run(eval_genomes, 10)
+# train.run(..., profile=True, stackFile=...) does both.
+
+PHASES = ["network", "observation", "getMove", "move", "gravity",
+        "placement", "lineClear", "spawn"]
+
+# Calls and seconds spent per phase. Phases can nest, e.g. a DROP move
+# places a piece, clears lines and spawns the next piece; the time of the
+# inner phases is not counted again in the outer one.
+class PhaseProfile:
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.phases = {}
+        self.nested = 0.0
+
+    def add(self, phase, seconds, calls=1):
+        oldCalls, oldSeconds = self.phases.get(phase, (0, 0.0))
+        self.phases[phase] = (oldCalls + calls, oldSeconds + seconds)
+
+    # phases: the phases of another PhaseProfile, e.g. from a worker
+    def merge(self, phases):
+        for phase, (calls, seconds) in phases.items():
+            self.add(phase, seconds, calls)
+
+    def call(self, phase, f, *args):
+        nested = self.nested
+        start = time.perf_counter()
+        result = f(*args)
+        elapsed = time.perf_counter() - start
+        self.add(phase, elapsed - (self.nested - nested))
+        self.nested = nested + elapsed
+        return result
+
+    def timed(self, phase, f):
+        return lambda *args: self.call(phase, f, *args)
+
+    def totalSeconds(self):
+        return sum(seconds for calls, seconds in self.phases.values())
+
+    def report(self):
+        total = self.totalSeconds() or 1.0
+        lines = ["  {:12s} {:>10s} {:>10s} {:>6s} {:>9s}".format(
+            "phase", "calls", "seconds", "%", "us/call")]
+        names = PHASES + sorted(set(self.phases) - set(PHASES))
+        for phase in names:
+            if phase not in self.phases:
+                continue
+            calls, seconds = self.phases[phase]
+            lines.append("  {:12s} {:10d} {:10.3f} {:6.1f} {:9.2f}".format(
+                phase, calls, seconds, 100*seconds/total, 1e6*seconds/max(calls, 1)))
+        return "\n".join(lines)
+
+# the PhaseProfile games are recorded in, or None when instrumentation is off
+profile = None
+
+def enable():
+    global profile
+    if profile is None:
+        profile = PhaseProfile()
+    return profile
+
+def disable():
+    global profile
+    profile = None
+
+# An AutomatedTetris that records every phase of every tick in a
+# PhaseProfile. Placement, line clear and spawn are timed by wrapping the
+# methods of this game's Tetris instance, so other games are not slowed.
+class InstrumentedAutomatedTetris(AutomatedTetris):
+
+    def __init__(self, controller, initrandomstate=None, recordMoves=True,
+            tetrisClass=Tetris, pieceSequence=None, phaseProfile=None):
+        AutomatedTetris.__init__(self, controller, initrandomstate,
+                recordMoves, tetrisClass, pieceSequence)
+        if phaseProfile is None:
+            phaseProfile = enable()
+        self.phaseProfile = phaseProfile
+        tetris = self.tetris
+        tetris.placeFallingPiece = phaseProfile.timed("placement", tetris.placeFallingPiece)
+        tetris.deleteCompleteRows = phaseProfile.timed("lineClear", tetris.deleteCompleteRows)
+        tetris.newFallingPiece = phaseProfile.timed("spawn", tetris.newFallingPiece)
+
+    def gravity(self):
+        return self.phaseProfile.call("gravity", self.tetris.step)
+
+    def getMove(self):
+        phaseProfile = self.phaseProfile
+        if self.features is not None:
+            features = phaseProfile.call("observation", self.features.asArray)
+            return phaseProfile.call("getMove", self.controller.getMoveFeatures, features)
+        if self.observation is None:
+            board = phaseProfile.call("observation", self.tetris.boardAsArray)
+            return phaseProfile.call("getMove", self.controller.getMove, board)
+        active = phaseProfile.call("observation", self.observation.activeIndices)
+        return phaseProfile.call("getMove", self.controller.getMoveSparse, active)
+
+    def applyMove(self, m):
+        self.phaseProfile.call("move", AutomatedTetris.applyMove, self, m)
+
+# the class to play a game with: InstrumentedAutomatedTetris while
+# instrumentation is enabled
+def automatedTetrisClass():
+    if profile is None:
+        return AutomatedTetris
+    return InstrumentedAutomatedTetris
+
+# Prints where the time of each generation went, after StdOutReporter's
+# summary: the phases of every game played (summed over all workers when
+# evaluating in parallel), the wall time of the whole evaluation and the
+# time neat spent on reproduction and speciation.
+class PhaseReporter(neat.reporting.BaseReporter):
+
+    def __init__(self, phaseProfile=None):
+        if phaseProfile is None:
+            phaseProfile = enable()
+        self.phaseProfile = phaseProfile
+
+    def start_generation(self, generation):
+        self.phaseProfile.reset()
+        self.generationStart = time.perf_counter()
+        self.evaluationEnd = None
+
+    def post_evaluate(self, config, population, species, best_genome):
+        self.evaluationEnd = time.perf_counter()
+
+    def end_generation(self, config, population, species_set):
+        now = time.perf_counter()
+        evaluation = self.evaluationEnd - self.generationStart
+        print(" Phases:")
+        print(self.phaseProfile.report())
+        print("  evaluation {:.3f} sec, reproduction {:.3f} sec".format(
+            evaluation, now - self.evaluationEnd))
+
+# A sampling profiler: a background thread that looks at the stack of one
+# thread every interval seconds and counts how often each stack was seen.
+# dump writes them in the collapsed format flamegraph.pl, speedscope and
+# inferno read, one "outermost;...;innermost count" line per stack. Worker
+# processes of a ParallelEvaluator are not sampled, use numWorkers=1.
+class StackSampler:
+
+    def __init__(self, filename=None, interval=0.005, thread=None):
+        self.filename = filename
+        self.interval = interval
+        if thread is None:
+            thread = threading.current_thread()
+        self.threadId = thread.ident
+        self.stacks = Counter()
+        self.running = False
+        self.sampler = None
+
+    def start(self):
+        self.running = True
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+
+    def stop(self):
+        self.running = False
+        if self.sampler is not None:
+            self.sampler.join()
+            self.sampler = None
+        if self.filename is not None:
+            self.dump(self.filename)
+
+    def sample(self):
+        while self.running:
+            frame = sys._current_frames().get(self.threadId)
+            if frame is not None:
+                self.stacks[self.collapse(frame)] += 1
+            del frame
+            time.sleep(self.interval)
+
+    @staticmethod
+    def collapse(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def dump(self, filename):
+        with open(filename, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write("{} {}\n".format(stack, count))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
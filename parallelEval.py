@@ -0,0 +1,232 @@
+import numpy as np
+import random
+import os
+from concurrent.futures import ProcessPoolExecutor, Future
+from automatedTetris import AutomatedTetris
+from train import networkController, TRIALS_PER_GENOME, buildNetwork
+import instrumentation
+from pieceSequence import SharedPieceTables
+
+MAX_MOVES = AutomatedTetris.FPS*600
+
+# the config every worker builds its networks with and the SharedPieceTables
+# of the trials (or None), set once per worker by the pool initializer so
+# they are not pickled with every task
+workerConfig = None
+workerPieces = None
+
+def setWorkerConfig(config, pieces=None):
+    global workerConfig, workerPieces
+    workerConfig = config
+    workerPieces = pieces
+
+# the same state random.seed(trial); random.getstate() gives in eval_genomes
+def trialRandomState(trial):
+    return random.Random(trial).getstate()
+
+# returns (score, index of the policy that stopped the game or None,
+#   ticks that policy saved). with a phaseProfile the trial is recorded in
+#   it, see instrumentation.py. pieceSequence: the trial's pieces, drawn from
+#   trialRandomState(trial) if None
+def playTrial(genome, config, trial, maxMoves=MAX_MOVES, stopPolicies=(),
+        phaseProfile=None, pieceSequence=None):
+    initrandomstate = None
+    if pieceSequence is None:
+        initrandomstate = trialRandomState(trial)
+    if phaseProfile is None:
+        net = buildNetwork(genome, config)
+        autoTetris = AutomatedTetris(networkController(net, config),
+                initrandomstate=initrandomstate, recordMoves=False,
+                pieceSequence=pieceSequence)
+    else:
+        net = phaseProfile.call("network", buildNetwork, genome, config)
+        autoTetris = instrumentation.InstrumentedAutomatedTetris(
+                networkController(net, config), initrandomstate=initrandomstate,
+                recordMoves=False, pieceSequence=pieceSequence,
+                phaseProfile=phaseProfile)
+    stoppedBy = autoTetris.play(maxMoves=maxMoves, stopPolicies=stopPolicies)
+    if stoppedBy is None:
+        return autoTetris.score(), None, 0
+    return autoTetris.score(), stopPolicies.index(stoppedBy), \
+            maxMoves-autoTetris.gameLength
+
+# returns the playTrial result and, if profiling, the trial's phases
+def playTask(task):
+    genome, trial, maxMoves, stopPolicies, profiling = task
+    pieceSequence = None
+    if workerPieces is not None:
+        pieceSequence = workerPieces.sequence(trial)
+    if not profiling:
+        return playTrial(genome, workerConfig, trial, maxMoves, stopPolicies,
+                pieceSequence=pieceSequence), None
+    phaseProfile = instrumentation.PhaseProfile()
+    result = playTrial(genome, workerConfig, trial, maxMoves, stopPolicies,
+            phaseProfile, pieceSequence)
+    return result, phaseProfile.phases
+
+# Drop-in replacement for train.eval_genomes that spreads every
+# (genome, trial) pair over a pool of worker processes. Each trial always
+# uses the same random state, so the fitnesses do not depend on numWorkers
+# or chunkSize. With numWorkers=1 everything runs in this process.
+# With a fitnessCache.FitnessCache, trials already played by an identical
+# network, in this or an earlier generation, are not played again.
+# stopPolicies are earlyStopping.EarlyStopPolicy objects used for every
+# trial; their counters add up the games stopped in all workers, and with
+# verbose they are printed after every generation. Scores of stopped games
+# are not cached.
+# With sharePieces the pieces of every trial are drawn once, into
+# SharedPieceTables that all workers map, instead of once per game.
+# While instrumentation is enabled the workers profile their trials and
+# the phases are added to instrumentation.profile.
+#   p.run(ParallelEvaluator(numWorkers=32), 1000)
+class ParallelEvaluator:
+
+    def __init__(self, numWorkers=None, chunkSize=1, trials=TRIALS_PER_GENOME,
+            maxMoves=MAX_MOVES, cache=None, stopPolicies=(), sharePieces=True,
+            verbose=False):
+        if numWorkers == None: numWorkers = os.cpu_count()
+        self.numWorkers = numWorkers
+        self.chunkSize = chunkSize
+        self.trials = trials
+        self.maxMoves = maxMoves
+        self.cache = cache
+        self.stopPolicies = list(stopPolicies)
+        # the best trial score of the generation being played and of the
+        # one before it
+        self.generationBest = 0
+        self.lastGenerationBest = 0
+        self.verbose = verbose
+        self.sharePieces = sharePieces
+        self.pieces = None
+        self.pool = None
+        self.poolConfig = None
+
+    # the SharedPieceTables of the trials, or None without sharePieces.
+    # the trials' pieces never change, so they are only drawn again if
+    # trials or maxMoves do
+    def getPieces(self):
+        if not self.sharePieces:
+            return None
+        shape = (self.trials, self.maxMoves+1, 2)
+        if self.pieces is None or self.pieces.shape != shape:
+            self.close()
+            self.pieces = SharedPieceTables.create(
+                    [trialRandomState(trial) for trial in range(self.trials)],
+                    self.maxMoves+1)
+        return self.pieces
+
+    def getPool(self, config):
+        pieces = self.getPieces()
+        if self.pool is None or self.poolConfig is not config:
+            self.closePool()
+            self.pool = ProcessPoolExecutor(self.numWorkers,
+                    initializer=setWorkerConfig, initargs=(config, pieces))
+            self.poolConfig = config
+        return self.pool
+
+    def closePool(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def close(self):
+        self.closePool()
+        if self.pieces is not None:
+            self.pieces.remove()
+            self.pieces = None
+
+    # returns a list of playTrial results
+    def playTasks(self, tasks, config):
+        if self.numWorkers == 1:
+            setWorkerConfig(config, self.getPieces())
+            results = list(map(playTask, tasks))
+        else:
+            pool = self.getPool(config)
+            results = list(pool.map(playTask, tasks, chunksize=self.chunkSize))
+            # the workers stopped games with copies of the policies
+            for (score, stoppedBy, ticksSaved), phases in results:
+                if stoppedBy is not None:
+                    self.stopPolicies[stoppedBy].stopped(ticksSaved)
+        if instrumentation.profile is not None:
+            for result, phases in results:
+                instrumentation.profile.merge(phases)
+        return [result for result, phases in results]
+
+    # tells the stop policies that a generation starts
+    def newGeneration(self):
+        self.lastGenerationBest = self.generationBest
+        self.generationBest = 0
+        for policy in self.stopPolicies:
+            policy.newGeneration(self.lastGenerationBest)
+
+    def __call__(self, genomes, config):
+        self.newGeneration()
+        profiling = instrumentation.profile is not None
+        tasks = [(genome, trial, self.maxMoves, self.stopPolicies, profiling)
+                for genome_id, genome in genomes
+                for trial in range(self.trials)]
+        if self.cache is None:
+            scores = [score for score, stoppedBy, ticksSaved
+                    in self.playTasks(tasks, config)]
+        else:
+            scores = self.playCachedTasks(tasks, config)
+        scores = np.array(scores).reshape(len(genomes), self.trials)
+        for (genome_id, genome), genomeScores in zip(genomes, scores):
+            genome.fitness = np.mean(genomeScores)
+        self.generationBest = max(self.generationBest, scores.max(initial=0))
+        if self.verbose:
+            for policy in self.stopPolicies:
+                print(" ", policy.report())
+
+    # Starts playing every trial of genome on the workers and returns at
+    # once, for steadyState.SteadyStateEvolution. Returns the futures of the
+    # playTask results, those of cached trials already done. finishGenome
+    # sets the genome's fitness once they are all done
+    def submitGenome(self, genome, config):
+        pool = self.getPool(config)
+        profiling = instrumentation.profile is not None
+        futures = []
+        for trial in range(self.trials):
+            score = None
+            if self.cache is not None:
+                score = self.cache.get(self.cache.key(genome, trial, self.maxMoves))
+            if score is None:
+                futures.append(pool.submit(playTask,
+                    (genome, trial, self.maxMoves, self.stopPolicies, profiling)))
+            else:
+                future = Future()
+                future.set_result(((score, None, 0), None))
+                futures.append(future)
+        return futures
+
+    def finishGenome(self, genome, futures):
+        scores = []
+        for trial, future in enumerate(futures):
+            (score, stoppedBy, ticksSaved), phases = future.result()
+            if stoppedBy is not None:
+                self.stopPolicies[stoppedBy].stopped(ticksSaved)
+            elif self.cache is not None:
+                self.cache.put(self.cache.key(genome, trial, self.maxMoves), score)
+            if phases is not None and instrumentation.profile is not None:
+                instrumentation.profile.merge(phases)
+            scores.append(score)
+        genome.fitness = np.mean(scores)
+        self.generationBest = max(self.generationBest, max(scores))
+
+    def playCachedTasks(self, tasks, config):
+        cache = self.cache
+        keys = [cache.key(genome, trial, maxMoves) for genome, trial, maxMoves, _, _ in tasks]
+        scores = [cache.get(key) for key in keys]
+        missing = {}
+        for key, task, score in zip(keys, tasks, scores):
+            if score is None and key not in missing:
+                missing[key] = task
+        results = self.playTasks(list(missing.values()), config)
+        played = {}
+        for key, (score, stoppedBy, ticksSaved) in zip(missing, results):
+            if stoppedBy is None:
+                cache.put(key, score)
+            played[key] = score
+        cache.sync()
+        return [played[key] if score is None else score
+                for key, score in zip(keys, scores)]
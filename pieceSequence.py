@@ -0,0 +1,194 @@
+import os
+import random
+import tempfile
+import weakref
+import numpy as np
+
+# Where a game's pieces come from. nextPiece returns the index of the next
+# piece in Tetris.tetriminoClasses() and how often to rotate it clockwise.
+# getstate/setstate save and restore the position in the sequence.
+class PieceSequence:
+
+    def nextPiece(self):
+        raise Exception("Abstract function not implemented")
+
+    # what nextPiece will return, without drawing it
+    def peekPiece(self):
+        state = self.getstate()
+        piece = self.nextPiece()
+        self.setstate(state)
+        return piece
+
+    def getstate(self):
+        raise Exception("Abstract function not implemented")
+
+    def setstate(self, state):
+        raise Exception("Abstract function not implemented")
+
+# The original pieces: two randint calls on a Mersenne Twister per piece.
+# Its state is random.Random's, about 2.5 KB.
+class RandomPieceSequence(PieceSequence):
+
+    def __init__(self, rng, numPieces=7):
+        self.rng = rng
+        self.numPieces = numPieces
+
+    def nextPiece(self):
+        piece = self.rng.randint(0, self.numPieces-1)
+        return piece, self.rng.randint(0, 3)
+
+    def getstate(self):
+        return self.rng.getstate()
+
+    def setstate(self, state):
+        self.rng.setstate(state)
+
+MASK64 = (1 << 64) - 1
+GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+BAG_STREAM = 0xD1B54A32D192ED03
+
+# the splitmix64 finalizer: a 64 bit hash of x
+def mix64(x):
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & MASK64
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EB & MASK64
+    return x ^ (x >> 31)
+
+# A counter-based sequence: piece i is a hash of (seed, i), so the whole
+# state is the number of pieces drawn. Snapshots are one int, and the
+# sequence can be started at any piece without drawing the ones before it.
+# With bag=True the pieces come in shuffled bags holding each piece once,
+# the way many Tetris versions deal them.
+#   Tetris(pieceSequence=CounterPieceSequence(seed))
+class CounterPieceSequence(PieceSequence):
+
+    def __init__(self, seed, bag=False, numPieces=7, counter=0):
+        self.seed = seed & MASK64
+        self.bag = bag
+        self.numPieces = numPieces
+        self.counter = counter
+        self.bagIndex = None
+
+    def draw(self, i, stream=0):
+        return mix64((self.seed + (stream + i + 1)*GOLDEN_GAMMA) & MASK64)
+
+    # the pieces of bag number index, a Fisher-Yates shuffle of all pieces
+    def shuffledBag(self, index):
+        pieces = list(range(self.numPieces))
+        first = index*self.numPieces
+        for j in range(self.numPieces-1, 0, -1):
+            k = (self.draw(first+j, BAG_STREAM) * (j+1)) >> 64
+            pieces[j], pieces[k] = pieces[k], pieces[j]
+        return pieces
+
+    def nextPiece(self):
+        i = self.counter
+        self.counter += 1
+        return self.pieceAt(i)
+
+    def peekPiece(self):
+        return self.pieceAt(self.counter)
+
+    def pieceAt(self, i):
+        x = self.draw(i)
+        rotations = x & 3
+        if not self.bag:
+            # the top bits, so they do not overlap the rotation's
+            return ((x >> 32) * self.numPieces) >> 32, rotations
+        index, position = divmod(i, self.numPieces)
+        if index != self.bagIndex:
+            self.bagPieces = self.shuffledBag(index)
+            self.bagIndex = index
+        return self.bagPieces[position], rotations
+
+    def getstate(self):
+        return self.counter
+
+    def setstate(self, state):
+        self.counter = state
+
+    def copy(self):
+        return CounterPieceSequence(self.seed, self.bag, self.numPieces, self.counter)
+
+# The pieces of a table made by pieceTable, e.g. a row of SharedPieceTables.
+# Reading past the end of the table raises IndexError. initrandomstate: the
+# state pieceTable drew the table from, if known, so that replays can store
+# it instead of the pieces.
+class ArrayPieceSequence(PieceSequence):
+
+    def __init__(self, table, index=0, initrandomstate=None):
+        self.table = table
+        self.index = index
+        self.initrandomstate = initrandomstate
+
+    def nextPiece(self):
+        i = self.index
+        self.index = i + 1
+        return self.table.item(i, 0), self.table.item(i, 1)
+
+    def peekPiece(self):
+        return self.table.item(self.index, 0), self.table.item(self.index, 1)
+
+    def getstate(self):
+        return self.index
+
+    def setstate(self, state):
+        self.index = state
+
+    def copy(self):
+        return ArrayPieceSequence(self.table, self.index, self.initrandomstate)
+
+# the first length pieces a RandomPieceSequence started from initrandomstate
+# draws, as a (length, 2) uint8 array of (piece, rotations)
+def pieceTable(initrandomstate, length, numPieces=7):
+    sequence = RandomPieceSequence(random.Random(), numPieces)
+    sequence.setstate(initrandomstate)
+    return np.array([sequence.nextPiece() for i in range(length)], dtype=np.uint8)
+
+# The piece tables of several trials in one memory-mapped file, so worker
+# processes can all read the same pages instead of each drawing the pieces.
+# Pickling only sends the file's name; the copy maps the file read-only.
+# A game of maxMoves ticks places at most maxMoves+1 pieces.
+#   tables = SharedPieceTables.create([trialRandomState(t) for t in range(3)], 6001)
+#   Tetris(pieceSequence=tables.sequence(trial))
+class SharedPieceTables:
+
+    def __init__(self, filename, trials, length, mode="r", initrandomstates=None):
+        self.filename = filename
+        self.shape = (trials, length, 2)
+        self.initrandomstates = initrandomstates
+        self.tables = np.memmap(filename, dtype=np.uint8, mode=mode, shape=self.shape)
+
+    @classmethod
+    def create(cls, initrandomstates, length, directory=None):
+        if directory is None and os.path.isdir("/dev/shm"):
+            directory = "/dev/shm"
+        fd, filename = tempfile.mkstemp(suffix=".pieces", dir=directory)
+        os.close(fd)
+        shared = cls(filename, len(initrandomstates), length, mode="w+",
+                initrandomstates=list(initrandomstates))
+        for trial, initrandomstate in enumerate(initrandomstates):
+            shared.tables[trial] = pieceTable(initrandomstate, length)
+        shared.tables.flush()
+        # also removed when shared is garbage collected or python exits
+        shared.removeFile = weakref.finalize(shared, removeIfExists, filename)
+        return shared
+
+    def sequence(self, trial):
+        return ArrayPieceSequence(self.tables[trial],
+                initrandomstate=self.initrandomstates[trial])
+
+    def __getstate__(self):
+        return self.filename, self.shape, self.initrandomstates
+
+    def __setstate__(self, state):
+        filename, (trials, length, _), initrandomstates = state
+        self.__init__(filename, trials, length, initrandomstates=initrandomstates)
+
+    # deletes the file, only for the SharedPieceTables create returned
+    def remove(self):
+        self.tables = None
+        self.removeFile()
+
+def removeIfExists(filename):
+    if os.path.exists(filename):
+        os.remove(filename)
@@ -18,6 +18,7 @@ class TetrisWindow(Tk):
         self.canvas.pack(fill=BOTH, expand=1)
         self.needToRedraw = False
         self.shadowsEnabled = shadowsEnabled
+        self.cellItems = None
 
         if not automated:
             self.refreshTimerFired()
@@ -41,85 +42,81 @@ class TetrisWindow(Tk):
         return (x0, y0, x1, y1)
 
     def getCellBoundingBox(self, row, col):
-        x0, y0, x1, y1 = self.getBoardBoundingBox()
+        x0, y0, x1, y1 = self.boardBox
         rows, cols = self.game.dim()
         dx = (x1-x0) / cols
         dy = (y1-y0) / rows 
         x2, y2 = x0 + dx*col, y0 + dy*row
         return (x2, y2, x2 + dx, y2 + dy)
 
-    def drawCell(self, row, col, color):
-        x0, y0, x1, y1 = self.getCellBoundingBox(row, col)
-        board = self.game.board
-        self.canvas.create_rectangle(x0, y0, x1, y1, fill=color)
-
     def repToColor(self, rep, clist=["gray", "red", "yellow", "magenta", "blue", "cyan", "lime", "orange"]):
         return clist[rep]
 
-    def drawBoard(self):
-        board = self.game.board
-        for row in range(len(board)):
-            for col in range(len(board[0])):
-                self.drawCell(row, col, self.repToColor(board[row][col]))
-
-    def drawFallingPiece(self):
-        for row, col in self.game.fallingPiece:
-            self.drawCell(row, col, self.game.fallingPiece.color) 
-
-    def drawFallingPieceShadow(self):
-        for row, col in self.game.fallingPiece.shadow():
-            self.drawCell(row, col, self.game.fallingPiece.shadowColor)
-
-    def drawGame(self):
+    # Creates one rectangle per cell and the text items, all laid out for
+    # the current canvas size. Later frames only change their colors and
+    # texts, until onResize or a board of another size makes them again.
+    def createItems(self):
         self.canvas.delete(ALL)
-        self.drawBoard()
+        self.boardBox = x0, y0, x1, y1 = self.getBoardBoundingBox()
+        self.itemsDim = rows, cols = self.game.dim()
+        self.cellItems = []
+        self.cellColors = [None]*(rows*cols)
+        for row in range(rows):
+            for col in range(cols):
+                bx0, by0, bx1, by1 = self.getCellBoundingBox(row, col)
+                self.cellItems.append(self.canvas.create_rectangle(bx0, by0, bx1, by1))
+        fontName = "DejaVu sans mono"
+        fontSize =  (y1-y0)//20 #in pixels
+        font = (fontName, -fontSize, "bold")
+        self.scoreItem = self.canvas.create_text(x0, y0, text="", anchor=NW,
+                font=font, fill="white")
+        self.messageItem = self.canvas.create_text((x0+x1)/2, (y0+y1)/2,
+                text="", justify=CENTER, font=font, fill="white")
+        self.texts = {}
+
+    # the color of every cell, row by row
+    def cellColorsOfGame(self):
+        game = self.game
+        cols = game.cols
+        colors = [self.repToColor(rep) for rep in game.board.ravel().tolist()]
+        fp = game.fallingPiece
         if self.shadowsEnabled:
-            self.drawFallingPieceShadow()
-        self.drawFallingPiece()
-        self.drawScore()
+            for row, col in fp.shadow():
+                if row >= 0:
+                    colors[row*cols+col] = fp.shadowColor
+        for row, col in fp:
+            if row >= 0:
+                colors[row*cols+col] = fp.color
+        return colors
+
+    def setText(self, item, text):
+        if self.texts.get(item) != text:
+            self.canvas.itemconfig(item, text=text)
+            self.texts[item] = text
+
+    # only reconfigures the cells whose color changed since the last frame
+    def drawGame(self):
+        if self.cellItems is None or self.itemsDim != self.game.dim():
+            self.createItems()
+        itemconfig = self.canvas.itemconfig
+        oldColors = self.cellColors
+        colors = self.cellColorsOfGame()
+        for i, color in enumerate(colors):
+            if color != oldColors[i]:
+                itemconfig(self.cellItems[i], fill=color)
+        self.cellColors = colors
+        self.setText(self.scoreItem, "Score: {}".format(self.game.score))
         if self.game.gameOver:
-            self.drawGameOverScreen()
+            self.setText(self.messageItem, "Game Over!\nHit r to restart.")
         elif self.game.isPaused:
-            self.drawPausedScreen()
-
-    def drawScore(self):
-        x0, y0, x1, y1 = self.getBoardBoundingBox()
-        text = "Score: {}".format(self.game.score)
-        fontName = "DejaVu sans mono"
-        fontSize =  (y1-y0)//20 #in pixels
-        self.canvas.create_text(x0, y0,
-                text=text,
-                anchor=NW,
-                font=(fontName, -fontSize, "bold"),
-                fill="white")
-
-    def drawGameOverScreen(self):
-        x0, y0, x1, y1 = self.getBoardBoundingBox()
-        cx, cy = (x0+x1)/2, (y0+y1)/2
-        text = "Game Over!\nHit r to restart."
-        fontName = "DejaVu sans mono"
-        fontSize =  (y1-y0)//20 #in pixels
-        self.canvas.create_text(cx, cy,
-                text=text,
-                justify=CENTER,
-                font=(fontName, -fontSize, "bold"),
-                fill="white")
-
-    def drawPausedScreen(self):
-        x0, y0, x1, y1 = self.getBoardBoundingBox()
-        cx, cy = (x0+x1)/2, (y0+y1)/2
-        text = "Paused.\nHit p to unpause."
-        fontName = "DejaVu sans mono"
-        fontSize =  (y1-y0)//20 #in pixels
-        self.canvas.create_text(cx, cy,
-                text=text,
-                justify=CENTER,
-                font=(fontName, -fontSize, "bold"),
-                fill="white")
+            self.setText(self.messageItem, "Paused.\nHit p to unpause.")
+        else:
+            self.setText(self.messageItem, "")
 
     def onResize(self, event):
         width, height = event.width, event.height
         self.canvas.config(width=width, height=height)
+        self.cellItems = None
         self.needToRedraw = True
 
     def gameTimerFired(self):
@@ -0,0 +1,305 @@
+import random
+import struct
+import numpy as np
+from pieceSequence import CounterPieceSequence, ArrayPieceSequence, RandomPieceSequence
+from tetris import Snapshot
+
+# Binary replay files, version 4. All numbers are little endian.
+#
+# header:   b"TTRP", version u8, rows u8, cols u8, fps u8, rngKind u8 and
+#           then either a u64 seed for random.Random(seed) (RNG_SEED), a
+#           packed Mersenne Twister state (RNG_STATE, see packRandomState)
+#           or the u64 seed, bag u8 and u64 counter at the first piece of a
+#           CounterPieceSequence (RNG_COUNTER, since version 2) or the
+#           pieces themselves, count u32 and then count (piece, rotations)
+#           u8 pairs (RNG_TABLE, since version 4)
+# chunks, each starting with a one byte tag:
+#   b"M"    count u16, then count moves packed 3 bits each, first move in
+#           the lowest bits of the first byte
+#   b"K"    keyframe: the complete game state before tick gameLength+1,
+#           gameLength u32, moveIndex u32 (moves recorded before it), score
+#           u32, piecesPlaced u32, piece class u8, maskIndex u8, row i8,
+#           col i8, gameOver u8, the board as rows*cols u8 and the u64
+#           counter with RNG_COUNTER, or else the number of pieces drawn
+#           u32, which are drawn again from the initial state on reading
+#           or, with RNG_TABLE, are the index of the next piece
+#           (version 2 stored the packed random state, about 2.5 KB)
+#   b"E"    end: gameLength u32, score u32, piecesPlaced u32, moveCount u32
+MAGIC = b"TTRP"
+VERSION = 4
+RNG_STATE = 0
+RNG_SEED = 1
+RNG_COUNTER = 2
+RNG_TABLE = 3
+MOVE_BITS = 3
+BLOCK_SIZE = 256
+
+HEADER = struct.Struct("<4sBBBBB")
+MOVES = struct.Struct("<H")
+KEYFRAME = struct.Struct("<IIIIBBbbB")
+END = struct.Struct("<IIII")
+SEED = struct.Struct("<Q")
+COUNTER = struct.Struct("<QBQ")
+COUNTER_STATE = struct.Struct("<Q")
+DRAWN = struct.Struct("<I")
+GAUSS = struct.Struct("<Bd")
+
+def isReplayFile(filename):
+    with open(filename, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def packRandomState(state):
+    version, internalstate, gauss = state
+    return np.array(internalstate, dtype="<u4").tobytes() + \
+            GAUSS.pack(gauss is not None, gauss or 0.0)
+
+def unpackRandomState(data, offset):
+    size = 625*4
+    internalstate = tuple(np.frombuffer(data[offset:offset+size], dtype="<u4").tolist())
+    hasGauss, gauss = GAUSS.unpack_from(data, offset+size)
+    return (3, internalstate, gauss if hasGauss else None), offset+size+GAUSS.size
+
+def readRandomState(f):
+    data = f.read(625*4 + GAUSS.size)
+    return unpackRandomState(data, 0)[0]
+
+# the position of a game's piece sequence as stored in keyframes
+def pieceStateSize(rngKind, version=VERSION):
+    if rngKind == RNG_COUNTER:
+        return COUNTER_STATE.size
+    if version < 3:
+        return 625*4 + GAUSS.size
+    return DRAWN.size
+
+def readPieceState(f, rngKind, version=VERSION):
+    if rngKind == RNG_COUNTER:
+        return COUNTER_STATE.unpack(f.read(COUNTER_STATE.size))[0]
+    if version < 3:
+        return readRandomState(f)
+    return DRAWN.unpack(f.read(DRAWN.size))[0]
+
+# the state of random.Random after a RandomPieceSequence drew pieces pieces
+# from initrandomstate
+def randomStateAfter(initrandomstate, pieces, numPieces=7):
+    sequence = RandomPieceSequence(random.Random(), numPieces)
+    sequence.setstate(initrandomstate)
+    for i in range(pieces):
+        sequence.nextPiece()
+    return sequence.getstate()
+
+def packMoves(moves):
+    bits = 0
+    for i, m in enumerate(moves):
+        bits |= m << (MOVE_BITS*i)
+    return bits.to_bytes((MOVE_BITS*len(moves)+7)//8, "little")
+
+def unpackMoves(data, count):
+    bits = int.from_bytes(data, "little")
+    mask = (1 << MOVE_BITS) - 1
+    return [(bits >> (MOVE_BITS*i)) & mask for i in range(count)]
+
+# Writes a replay as the game is played. Moves are buffered and written in
+# blocks, and every keyframeInterval ticks the full game state is written
+# so readers can start from the middle of the game. If the game's
+# initrandomstate is that of random.Random(seed), pass seed to store just
+# the seed instead of the whole state. Games drawing their pieces from a
+# CounterPieceSequence always store just its seed. An ArrayPieceSequence
+# that knows the initrandomstate of its table, like the training games',
+# is stored as that state, or seed, and otherwise by its pieces.
+class ReplayWriter:
+
+    def __init__(self, filename, tetris, fps, seed=None, keyframeInterval=1000):
+        self.f = open(filename, "wb")
+        self.keyframeInterval = keyframeInterval
+        self.moves = []
+        self.moveCount = 0
+        pieces = tetris.pieceSequence
+        if isinstance(pieces, CounterPieceSequence):
+            self.rngKind = RNG_COUNTER
+            self.f.write(HEADER.pack(MAGIC, VERSION, tetris.rows, tetris.cols, fps,
+                RNG_COUNTER))
+            self.f.write(COUNTER.pack(pieces.seed, pieces.bag,
+                tetris.initialPieceState))
+            return
+        initrandomstate = tetris.initrandomstate
+        if isinstance(pieces, ArrayPieceSequence):
+            if pieces.initrandomstate is None:
+                self.rngKind = RNG_TABLE
+                table = pieces.table[tetris.initialPieceState:]
+                self.f.write(HEADER.pack(MAGIC, VERSION, tetris.rows, tetris.cols, fps,
+                    RNG_TABLE))
+                self.f.write(DRAWN.pack(len(table)))
+                self.f.write(np.ascontiguousarray(table, dtype=np.uint8).tobytes())
+                return
+            # the table holds what random.Random draws from its state
+            initrandomstate = randomStateAfter(pieces.initrandomstate,
+                    tetris.initialPieceState, tetris.numTetriminos)
+        elif tetris.rng is None:
+            raise ValueError("can only record random.Random, counter and array piece sequences")
+        useSeed = seed != None and 0 <= seed < 2**64 and \
+                random.Random(seed).getstate() == initrandomstate
+        self.rngKind = RNG_SEED if useSeed else RNG_STATE
+        self.f.write(HEADER.pack(MAGIC, VERSION, tetris.rows, tetris.cols, fps,
+            self.rngKind))
+        if useSeed:
+            self.f.write(SEED.pack(seed))
+        else:
+            self.f.write(packRandomState(initrandomstate))
+
+    def recordMove(self, move):
+        self.moves.append(move)
+        self.moveCount += 1
+        if len(self.moves) == BLOCK_SIZE:
+            self.flushMoves()
+
+    def flushMoves(self):
+        if self.moves:
+            self.f.write(b"M" + MOVES.pack(len(self.moves)) + packMoves(self.moves))
+            self.moves = []
+
+    # called by AutomatedTetris.step before every tick
+    def beforeTick(self, autoTetris):
+        if autoTetris.gameLength > 0 and autoTetris.gameLength % self.keyframeInterval == 0:
+            self.writeKeyframe(autoTetris)
+
+    def writeKeyframe(self, autoTetris):
+        self.flushMoves()
+        s = autoTetris.tetris.snapshot()
+        self.f.write(b"K" + KEYFRAME.pack(autoTetris.gameLength, self.moveCount,
+            s.score, s.piecesPlaced, s.piece, s.rotation, s.row, s.col, s.gameOver))
+        self.f.write(s.board)
+        if self.rngKind == RNG_COUNTER:
+            self.f.write(COUNTER_STATE.pack(s.pieceState))
+        else:
+            # Tetris draws the next piece as it places one
+            self.f.write(DRAWN.pack(s.piecesPlaced + 1))
+
+    def close(self, autoTetris):
+        if self.f is None:
+            return
+        self.flushMoves()
+        tetris = autoTetris.tetris
+        self.f.write(b"E" + END.pack(autoTetris.gameLength, tetris.score,
+            tetris.piecesPlaced, self.moveCount))
+        self.f.close()
+        self.f = None
+
+# Writes a finished game's recorded moves in one go, without keyframes.
+def writeReplay(filename, autoTetris, seed=None):
+    writer = ReplayWriter(filename, autoTetris.tetris, autoTetris.FPS, seed)
+    for m in autoTetris.moves:
+        writer.recordMove(m)
+    writer.close(autoTetris)
+
+# Reads a replay file without loading all of its moves. Opening it only
+# reads the header and the chunk headers, to find the keyframes and where
+# each block of moves starts.
+class ReplayReader:
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            magic, version, self.rows, self.cols, self.fps, rngKind = \
+                    HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError("{} is not a replay file".format(filename))
+            if not 1 <= version <= VERSION:
+                raise ValueError("unsupported replay version {}".format(version))
+            self.version = version
+            self.rngKind = rngKind
+            self.seed = None
+            self.initrandomstate = None
+            if rngKind == RNG_SEED:
+                self.seed, = SEED.unpack(f.read(SEED.size))
+                self.initrandomstate = random.Random(self.seed).getstate()
+            elif rngKind == RNG_COUNTER:
+                self.seed, self.bag, self.initialCounter = \
+                        COUNTER.unpack(f.read(COUNTER.size))
+            elif rngKind == RNG_TABLE:
+                count, = DRAWN.unpack(f.read(DRAWN.size))
+                self.table = np.frombuffer(f.read(2*count), dtype=np.uint8).reshape(count, 2)
+            else:
+                self.initrandomstate = readRandomState(f)
+            self.scanChunks(f)
+
+    # the piece sequence to play the game with, None for random.Random games
+    # which are started from initrandomstate
+    def newPieceSequence(self):
+        if self.rngKind == RNG_TABLE:
+            return ArrayPieceSequence(self.table)
+        if self.rngKind != RNG_COUNTER:
+            return None
+        return CounterPieceSequence(self.seed, bool(self.bag),
+                counter=self.initialCounter)
+
+    def scanChunks(self, f):
+        # moveBlocks: (index of the block's first move, offset, count)
+        self.moveBlocks = []
+        # keyframes: (gameLength, moveIndex, offset)
+        self.keyframes = []
+        self.end = None
+        moveIndex = 0
+        keyframeSize = KEYFRAME.size + self.rows*self.cols + \
+                pieceStateSize(self.rngKind, self.version)
+        while True:
+            tag = f.read(1)
+            if tag == b"M":
+                count, = MOVES.unpack(f.read(MOVES.size))
+                self.moveBlocks.append((moveIndex, f.tell(), count))
+                moveIndex += count
+                f.seek((MOVE_BITS*count+7)//8, 1)
+            elif tag == b"K":
+                offset = f.tell()
+                gameLength, keyframeMoves = struct.unpack("<II", f.read(8))
+                self.keyframes.append((gameLength, keyframeMoves, offset))
+                f.seek(offset + keyframeSize)
+            elif tag == b"E":
+                gameLength, score, piecesPlaced, moveCount = END.unpack(f.read(END.size))
+                self.end = {"gameLength": gameLength, "score": score,
+                        "piecesPlaced": piecesPlaced, "moveCount": moveCount}
+            else:
+                # end of file, or of what a writer still playing has flushed
+                break
+        self.moveCount = moveIndex
+
+    # the recorded moves from moveIndex on, read one block at a time
+    def moves(self, moveIndex=0):
+        with open(self.filename, "rb") as f:
+            for start, offset, count in self.moveBlocks:
+                if start + count <= moveIndex:
+                    continue
+                f.seek(offset)
+                block = unpackMoves(f.read((MOVE_BITS*count+7)//8), count)
+                for m in block[max(0, moveIndex-start):]:
+                    yield m
+
+    # the last keyframe at or before tick, or None
+    def keyframeBefore(self, tick):
+        best = None
+        for keyframe in self.keyframes:
+            if keyframe[0] <= tick:
+                best = keyframe
+        return best
+
+    # the state of tetris' random.Random after drawing drawn pieces from
+    # initrandomstate
+    def pieceStateAfter(self, tetris, drawn):
+        pieces = tetris.pieceSequence
+        pieces.setstate(self.initrandomstate)
+        for i in range(drawn):
+            pieces.nextPiece()
+        return pieces.getstate()
+
+    # puts the state saved in a keyframe into tetris
+    def restoreKeyframe(self, keyframe, tetris):
+        with open(self.filename, "rb") as f:
+            f.seek(keyframe[2])
+            (gameLength, moveIndex, score, piecesPlaced, pieceIndex, maskIndex,
+                    row, col, gameOver) = KEYFRAME.unpack(f.read(KEYFRAME.size))
+            board = f.read(self.rows*self.cols)
+            pieceState = readPieceState(f, self.rngKind, self.version)
+        if self.rngKind in (RNG_STATE, RNG_SEED) and self.version >= 3:
+            pieceState = self.pieceStateAfter(tetris, pieceState)
+        tetris.restore(Snapshot(board, pieceIndex, maskIndex, row, col, score,
+            piecesPlaced, bool(gameOver), pieceState))
+        return gameLength, moveIndex
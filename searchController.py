@@ -0,0 +1,96 @@
+from controller import Controller
+from tetris import Tetris
+from pieceSequence import mix64
+from zobrist import ZobristHash, TranspositionTable
+
+# a board evaluation for SearchController: lower stacks are better
+def negativeHeight(tetris):
+    return -sum(tetris.rows - top for top in tetris.columnTops)
+
+# Tries every sequence of depth moves with Tetris.snapshot and restore and
+# plays the first move of the best one. A sequence is worth the points it
+# scores plus evaluate(tetris) of the state it ends in. Different move
+# orders that lead to the same state, e.g. LEFT-ROTATE and ROTATE-LEFT, are
+# only searched once: searched states go into a TranspositionTable and
+# evaluated ones into a second one, both keyed by a ZobristHash. Gravity is
+# left out of the search, and dropped pieces are followed by the game's real
+# next piece, as if the next piece were shown.
+#   controller = SearchController(negativeHeight)
+#   autoTetris = AutomatedTetris(controller)
+#   controller.attach(autoTetris.tetris)
+class SearchController(Controller):
+
+    MOVES = [Tetris.LEFT, Tetris.RIGHT, Tetris.ROTATE, Tetris.DOWN, Tetris.DROP]
+
+    def __init__(self, evaluate, depth=3, table=None, evaluations=None):
+        self.evaluate = evaluate
+        self.depth = depth
+        if table is None: table = TranspositionTable()
+        if evaluations is None: evaluations = TranspositionTable()
+        self.table = table
+        self.evaluations = evaluations
+        self.tetris = None
+
+    # the game to search, call it before the first getMove of every game
+    def attach(self, tetris):
+        self.tetris = tetris
+        self.zobrist = ZobristHash(tetris)
+        self.table.clear()
+        self.evaluations.clear()
+
+    def applyMove(self, m):
+        tetris = self.tetris
+        score = tetris.score
+        if m == Tetris.LEFT:
+            tetris.tryMoveLeft()
+        elif m == Tetris.RIGHT:
+            tetris.tryMoveRight()
+        elif m == Tetris.ROTATE:
+            tetris.tryRotateClockwise()
+        elif m == Tetris.DOWN:
+            tetris.tryMoveDown()
+        elif m == Tetris.DROP:
+            tetris.dropFallingPiece()
+        return tetris.score - score
+
+    # the key of the current state: the pieces to come depend on how many
+    # were placed since the search started
+    def key(self):
+        return self.zobrist.key() ^ mix64(self.tetris.piecesPlaced)
+
+    def evaluateState(self, key):
+        value = self.evaluations.get(key)
+        if value is None:
+            value = self.evaluate(self.tetris)
+            self.evaluations.put(key, 0, value)
+        return value
+
+    # the best value reachable in depth moves
+    def search(self, depth):
+        tetris = self.tetris
+        key = self.key()
+        if depth == 0 or tetris.gameOver:
+            return self.evaluateState(key)
+        value = self.table.get(key, depth)
+        if value is not None:
+            return value
+        node = tetris.snapshot()
+        value = float("-inf")
+        for m in SearchController.MOVES:
+            gain = self.applyMove(m)
+            value = max(value, gain + self.search(depth-1))
+            tetris.restore(node)
+        self.table.put(key, depth, value)
+        return value
+
+    def getMove(self, board):
+        tetris = self.tetris
+        root = tetris.snapshot()
+        move, bestValue = Tetris.NOP, float("-inf")
+        for m in SearchController.MOVES:
+            gain = self.applyMove(m)
+            value = gain + self.search(self.depth-1)
+            tetris.restore(root)
+            if value > bestValue:
+                move, bestValue = m, value
+        return move
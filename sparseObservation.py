@@ -0,0 +1,64 @@
+from tetris import TetrisObserver
+import numpy as np
+
+# Keeps the boardAsArray observation of a Tetris game up to date instead of
+# rebuilding it every tick. The placed cells are only touched when a piece
+# is placed or rows are deleted, and the falling piece's cells only when it
+# has moved, so the work per tick scales with the occupied cells rather
+# than with the board area. Besides the dense array it offers the indices
+# of the occupied cells and of the cells changed by the last update.
+class SparseBoardObservation(TetrisObserver):
+
+    def __init__(self, tetris):
+        self.tetris = tetris
+        self.cols = tetris.cols
+        self.array = np.zeros(tetris.rows*tetris.cols, dtype=int)
+        self.boardCells = set(np.flatnonzero(tetris.board).tolist())
+        self.active = set()
+        self.changed = []
+        self.pieceKey = None
+        self.boardChanged = True
+        tetris.addObserver(self)
+
+    def piecePlaced(self, cells):
+        cols = self.cols
+        self.boardCells.update(r*cols+c for r, c in cells)
+        self.boardChanged = True
+
+    def rowsDeleted(self, rows):
+        self.boardCells = set(np.flatnonzero(self.tetris.board).tolist())
+        self.boardChanged = True
+
+    def boardLoaded(self):
+        self.rowsDeleted(None)
+
+    def update(self):
+        fp = self.tetris.fallingPiece
+        pieceKey = (fp, fp.maskIndex, fp.row, fp.col)
+        if pieceKey == self.pieceKey and not self.boardChanged:
+            self.changed = []
+            return
+        self.pieceKey = pieceKey
+        self.boardChanged = False
+        cols = self.cols
+        active = self.boardCells.union([r*cols+c for r, c in fp])
+        changed = list(active.symmetric_difference(self.active))
+        if changed:
+            self.array[changed] = [i in active for i in changed]
+        self.active = active
+        self.changed = changed
+
+    # the same values as tetris.boardAsArray(), shared between calls so it
+    # must not be modified
+    def asArray(self):
+        self.update()
+        return self.array
+
+    # indices of the cells that are 1 in asArray()
+    def activeIndices(self):
+        self.update()
+        return np.fromiter(self.active, dtype=int, count=len(self.active))
+
+    # indices of the cells whose value changed in the last update
+    def changedIndices(self):
+        return self.changed
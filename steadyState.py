@@ -0,0 +1,217 @@
+import math
+import random
+from concurrent.futures import wait, FIRST_COMPLETED
+import neat
+from neat.math_util import mean
+
+# Steady-state NEAT. neat.Population.run evaluates a whole generation and
+# waits for its slowest game before breeding the next one, so the workers
+# idle while the few good controllers play their 6000 ticks. Here every
+# free worker gets a new offspring at once, bred from the genomes evaluated
+# so far, and an offspring whose games are over replaces the worst genome.
+#   p = neat.Population(config)
+#   SteadyStateEvolution(p).run(ParallelEvaluator(), 1000)
+# train.run(..., steadyState=True) does that.
+#
+# The train_config sections are used the way DefaultReproduction uses
+# them: parents come from the best survival_threshold of a species, picked
+# with probability proportional to its adjusted fitness, and the elitism
+# best genomes of every species are never replaced. An offspring joins the
+# first species whose representative is within compatibility_threshold.
+# Every pop_size offspring make a generation for the reporters: stagnant
+# species are removed as DefaultStagnation decides and the population is
+# speciated again, so StdOutReporter, StatisticsReporter and
+# checkpoint.BackgroundCheckpointer work as with Population.run.
+class SteadyStateEvolution:
+
+    # population: a neat.Population, whose genomes, species, reporters and
+    #   reproduction are used and kept up to date, e.g. from
+    #   checkpoint.restoreCheckpoint. genomes without fitness are evaluated
+    #   before any offspring is bred
+    def __init__(self, population):
+        self.p = population
+        self.config = population.config
+        self.reproduction = population.reproduction
+        self.reporters = population.reporters
+        self.elitism = self.config.reproduction_config.elitism
+        self.survivalThreshold = self.config.reproduction_config.survival_threshold
+        self.compatibilityThreshold = \
+                self.config.species_set_config.compatibility_threshold
+        self.births = 0
+
+    # n: generations of pop_size offspring, None to run until the fitness
+    #   threshold is reached
+    # evaluator: a parallelEval.ParallelEvaluator or anything else with
+    #   submitGenome, finishGenome, newGeneration and numWorkers
+    # returns the best genome found, like Population.run
+    def run(self, evaluator, n=None):
+        p = self.p
+        config = self.config
+        if config.no_fitness_termination and n is None:
+            raise RuntimeError("Cannot have no generational limit with no fitness termination")
+        # the genomes in p.population still to be evaluated; the ones being
+        # evaluated are not in p.population until they are done
+        unevaluated = [g for g in p.population.values() if g.fitness is None]
+        for g in unevaluated:
+            self.removeGenome(g.key)
+        inFlight = max(1, evaluator.numWorkers // getattr(evaluator, "trials", 1))
+        # key: genome and key: the futures of its trials, for the genomes
+        # being evaluated
+        playing = {}
+        futures = {}
+        generations = 0
+        self.startGeneration(evaluator)
+        try:
+            while n is None or generations < n:
+                while len(futures) < inFlight and (unevaluated or p.population):
+                    genome = unevaluated.pop(0) if unevaluated else self.breed()
+                    futures[genome.key] = evaluator.submitGenome(genome, config)
+                    playing[genome.key] = genome
+                done, notDone = wait([f for fs in futures.values() for f in fs],
+                        return_when=FIRST_COMPLETED)
+                for key in [key for key, fs in futures.items()
+                        if all(f.done() for f in fs)]:
+                    genome = playing.pop(key)
+                    evaluator.finishGenome(genome, futures.pop(key))
+                    self.insert(genome)
+                    if self.solved():
+                        return p.best_genome
+                    if self.births % config.pop_size == 0 and not unevaluated:
+                        self.endGeneration()
+                        generations += 1
+                        if n is not None and generations >= n:
+                            break
+                        self.startGeneration(evaluator)
+                        if not p.population:
+                            unevaluated = self.extinct()
+        finally:
+            for fs in futures.values():
+                for f in fs:
+                    f.cancel()
+        if config.no_fitness_termination:
+            self.reporters.found_solution(config, p.generation, p.best_genome)
+        return p.best_genome
+
+    def startGeneration(self, evaluator):
+        self.reporters.start_generation(self.p.generation)
+        evaluator.newGeneration()
+        # innovations found in one generation get the same numbers
+        tracker = getattr(self.reproduction, "innovation_tracker", None)
+        if tracker is not None:
+            self.config.genome_config.innovation_tracker = tracker
+            tracker.reset_generation()
+
+    # an offspring of two parents from a species picked by adjusted fitness
+    def breed(self):
+        speciesList = [s for s in self.p.species.species.values() if s.members]
+        fitnesses = [m.fitness for s in speciesList for m in s.members.values()]
+        minFitness = min(fitnesses)
+        fitnessRange = max(1.0, max(fitnesses) - minFitness)
+        weights = [(mean([m.fitness for m in s.members.values()]) - minFitness)
+                / fitnessRange for s in speciesList]
+        if sum(weights) > 0:
+            s = random.choices(speciesList, weights)[0]
+        else:
+            s = random.choice(speciesList)
+        members = sorted(s.members.items(), reverse=True,
+                key=lambda x: (x[1].fitness, x[0]))
+        cutoff = max(2, int(math.ceil(self.survivalThreshold * len(members))))
+        parents = members[:cutoff]
+        parent1_id, parent1 = random.choice(parents)
+        parent2_id, parent2 = random.choice(parents)
+        gid = next(self.reproduction.genome_indexer)
+        child = self.config.genome_type(gid)
+        child.configure_crossover(parent1, parent2, self.config.genome_config)
+        child.mutate(self.config.genome_config)
+        self.reproduction.ancestors[gid] = (parent1_id, parent2_id)
+        return child
+
+    # adds an evaluated genome, replacing the genome with the worst fitness
+    # per member of its species once the population is full
+    def insert(self, genome):
+        p = self.p
+        config = self.config
+        if len(p.population) >= config.pop_size:
+            self.removeGenome(self.worstGenome().key)
+        p.population[genome.key] = genome
+        speciesSet = p.species
+        for s in speciesSet.species.values():
+            if genome.distance(s.representative, config.genome_config) \
+                    < self.compatibilityThreshold:
+                break
+        else:
+            sid = next(speciesSet.indexer)
+            s = neat.species.Species(sid, p.generation)
+            s.representative = genome
+            speciesSet.species[sid] = s
+        s.members[genome.key] = genome
+        speciesSet.genome_to_species[genome.key] = s.key
+        self.births += 1
+        if p.best_genome is None or genome.fitness > p.best_genome.fitness:
+            p.best_genome = genome
+
+    # the genome with the lowest fitness divided by its species' size,
+    # leaving out the elitism best of every species unless there is no
+    # other genome
+    def worstGenome(self):
+        worst, worstValue = None, None
+        for s in self.p.species.species.values():
+            members = sorted(s.members.values(), reverse=True,
+                    key=lambda g: (g.fitness, g.key))
+            for g in members[self.elitism:]:
+                value = g.fitness / len(members)
+                if worst is None or value < worstValue:
+                    worst, worstValue = g, value
+        if worst is None:
+            worst = min(self.p.population.values(), key=lambda g: (g.fitness, g.key))
+        return worst
+
+    def removeGenome(self, key):
+        p = self.p
+        p.population.pop(key, None)
+        sid = p.species.genome_to_species.pop(key, None)
+        if sid is not None:
+            s = p.species.species[sid]
+            del s.members[key]
+            if not s.members:
+                del p.species.species[sid]
+
+    def solved(self):
+        p = self.p
+        if self.config.no_fitness_termination:
+            return False
+        fv = p.fitness_criterion(g.fitness for g in p.population.values())
+        if fv >= self.config.fitness_threshold:
+            self.reporters.found_solution(self.config, p.generation, p.best_genome)
+            return True
+        return False
+
+    # what Population.run does between two generations, without breeding
+    def endGeneration(self):
+        p = self.p
+        config = self.config
+        best = max(p.population.values(), key=lambda g: g.fitness)
+        self.reporters.post_evaluate(config, p.population, p.species, best)
+        for sid, s, stagnant in self.reproduction.stagnation.update(p.species, p.generation):
+            if stagnant:
+                self.reporters.species_stagnant(sid, s)
+                for key in list(s.members):
+                    self.removeGenome(key)
+        if p.population:
+            p.species.speciate(config, p.population, p.generation)
+        self.reporters.end_generation(config, p.population, p.species)
+        p.generation += 1
+
+    # a new population to evaluate after every species stagnated, with
+    # reset_on_extinction
+    def extinct(self):
+        p = self.p
+        config = self.config
+        self.reporters.complete_extinction()
+        if not config.reset_on_extinction:
+            raise neat.CompleteExtinctionException()
+        p.population = self.reproduction.create_new(config.genome_type,
+                config.genome_config, config.pop_size)
+        unevaluated = list(p.population.values())
+        p.population = {}
+        return unevaluated
@@ -1,5 +1,21 @@
 import random
 import numpy as np
+from collections import namedtuple
+from pieceSequence import RandomPieceSequence
+
+# a final resting position of the falling piece: rotation is its maskIndex,
+# row and column the top left of its cells, board the board after placing it
+# and deleting the rows it completes
+Placement = namedtuple("Placement", "rotation column row board linesCleared")
+
+# the state of a game at one moment, see Tetris.snapshot: board is the board
+# as rows*cols uint8 bytes, piece the index of the falling piece's class in
+# tetriminos, rotation its maskIndex and pieceState that of pieceSequence.
+# observerStates holds TetrisObserver.getstate of every observer, or is None
+# if the observers are to rescan the board
+Snapshot = namedtuple("Snapshot",
+        "board piece rotation row col score piecesPlaced gameOver pieceState "
+        "observerStates", defaults=(None,))
 
 class Tetris:
     DEFAULT_ROWS = 15
@@ -16,21 +32,37 @@ class Tetris:
     NOP = 5
     POSSIBLE_MOVES = [LEFT, RIGHT, ROTATE, DOWN]
 
-    def __init__(self, rows=None, cols=None, initrandomstate=None):
+    # pieceSequence: a pieceSequence.PieceSequence to draw the pieces from
+    #   instead of a random.Random with initrandomstate. rng and
+    #   initrandomstate are None then. initialPieceState is the sequence's
+    #   state before the first piece either way
+    def __init__(self, rows=None, cols=None, initrandomstate=None,
+            pieceSequence=None):
         if rows == None: rows = Tetris.DEFAULT_ROWS 
         if cols == None: cols = Tetris.DEFAULT_COLS
         self.rows, self.cols = rows, cols
         self.score = 0
+        self.piecesPlaced = 0
         self.emptyColor = Tetris.DEFAULT_EMPTY_COLOR
-        self.rng = random.Random()
-        if initrandomstate:
-            self.rng.setstate(initrandomstate)
-        self.initrandomstate = self.rng.getstate()
+        self.tetriminos = self.tetriminoClasses()
+        self.numTetriminos = len(self.tetriminos)
+        self.pieceIndex = {clazz: i for i, clazz in enumerate(self.tetriminos)}
+        self.piecePool = [None]*self.numTetriminos
+        if pieceSequence is None:
+            self.rng = random.Random()
+            if initrandomstate:
+                self.rng.setstate(initrandomstate)
+            self.initrandomstate = self.rng.getstate()
+            pieceSequence = RandomPieceSequence(self.rng, self.numTetriminos)
+            self.initialPieceState = self.initrandomstate
+        else:
+            self.rng = None
+            self.initrandomstate = None
+            self.initialPieceState = pieceSequence.getstate()
+        self.pieceSequence = pieceSequence
+        self.observers = []
         self.newBoard()
         self.stepDelay = Tetris.DEFAULT_STEP_DELAY
-        self.tetriminos = (Tetrimino_T, Tetrimino_O, Tetrimino_I, Tetrimino_J,
-                Tetrimino_L, Tetrimino_S, Tetrimino_Z)
-        self.numTetriminos = len(self.tetriminos)
         self.maxDimOfTetrimino = self.computeMaxDimOfTetrimino()
         self.newFallingPiece()
         self.EMPTY_ROW = np.zeros((1,Tetris.DEFAULT_COLS))
@@ -38,6 +70,16 @@ class Tetris:
         self.gameOver = False
         self.isPaused = False
     
+    # the order of this tuple decides which piece each draw of the piece
+    # sequence produces
+    def tetriminoClasses(self):
+        return (Tetrimino_T, Tetrimino_O, Tetrimino_I, Tetrimino_J,
+                Tetrimino_L, Tetrimino_S, Tetrimino_Z)
+
+    # observer: a TetrisObserver told about every change to the board
+    def addObserver(self, observer):
+        self.observers.append(observer)
+
     def togglePaused(self):
         self.isPaused = not self.isPaused
 
@@ -56,13 +98,17 @@ class Tetris:
             return False
         success = self.fallingPiece.tryMoveDown()
         if not success:
-            self.placeFallingPiece()
-            self.deleteCompleteRows()
-            self.newFallingPiece()
-            if not self.fallingPiece.fitsOnBoard():
-                self.gameOver = True
+            self.lockFallingPiece()
         return success
 
+    def lockFallingPiece(self):
+        self.placeFallingPiece()
+        deleted = self.deleteCompleteRows()
+        self.newFallingPiece()
+        if not self.fallingPiece.fitsOnBoard():
+            self.gameOver = True
+        return deleted
+
     def rowIsComplete(self, row):
         return row >= 0 and np.all(self.board[row])
 
@@ -75,8 +121,10 @@ class Tetris:
     def deleteCompleteRows(self):
         i = self.rows-1
         deleted = 0
+        deletedRows = []
         while i >= 0:
             while self.rowIsComplete(i-deleted):
+                deletedRows.append(i-deleted)
                 deleted += 1
             if deleted > 0:
                 if i-deleted >= 0:
@@ -85,10 +133,18 @@ class Tetris:
                     self.board[i] = self.EMPTY_ROW
             i -= 1
         self.score += self.pointsFromCompleteRows(deleted)
+        if deleted > 0:
+            self.updateColumnTops()
+            for observer in self.observers:
+                observer.rowsDeleted(deletedRows)
         return deleted
 
     def dropFallingPiece(self):
-        while self.step(): pass
+        if self.gameOver:
+            return
+        fp = self.fallingPiece
+        fp.moveTo(fp.row + self.dropDistance(fp), fp.col)
+        self.lockFallingPiece()
 
     def tryMoveLeft(self):
         return self.fallingPiece.tryMoveLeft()
@@ -105,6 +161,164 @@ class Tetris:
     def tryRotateCounterClockwise(self):
         return self.fallingPiece.tryRotateCounterClockwise()
 
+    # for every column the index of its topmost occupied row, or rows if empty
+    def columnSurface(self):
+        return self.columnTops
+
+    # how many rows the falling piece fp can move down before it lands,
+    # looked up from the column tops and the lowest cell of each of its
+    # columns
+    def dropDistance(self, fp):
+        left, lows = fp.bottomProfiles()[fp.maskIndex]
+        columnTops = self.columnTops
+        col = fp.col + left
+        row = fp.row
+        distance = self.rows
+        for j, low in enumerate(lows):
+            d = columnTops[col+j] - row - low
+            if d < distance:
+                distance = d
+        if distance <= 0:
+            # something is above the piece in one of its columns, so it
+            # might slide under an overhang; find its landing row the slow way
+            distance = 0
+            while fp.tryMoveDown():
+                distance += 1
+            fp.moveTo(row, fp.col)
+            return distance
+        return distance - 1
+
+    # the top row the falling piece, already in the profile's rotation, lands
+    # on when moved to the given leftmost column and dropped straight down
+    def landingRow(self, fp, profile, column, surface):
+        rotation, width, bottom, rowOffset, colOffset = profile
+        row = min([surface[column+j] - bottom[j] for j in range(width)]) - 1
+        if row + rowOffset < fp.row:
+            # the piece is under an overhang, find its landing row the slow way
+            originalRow, originalCol = fp.row, fp.col
+            fp.moveTo(fp.row, column+colOffset)
+            while fp.tryMoveDown(): pass
+            row = fp.row - rowOffset
+            fp.moveTo(originalRow, originalCol)
+        return row
+
+    # every placement the falling piece can reach from where it is now by
+    # moving sideways and rotating clockwise in any order, as the LEFT, RIGHT
+    # and ROTATE moves would, and then dropping straight down. landing rows
+    # come from the column surface and the pieces' bottom profiles rather
+    # than from moving the piece down step by step. placements come in the
+    # order of placementProfiles
+    def placements(self):
+        fp = self.fallingPiece
+        if self.gameOver:
+            return []
+        state = fp.maskIndex, fp.row, fp.col
+        surface = self.columnSurface()
+        rotationProfiles = fp.rotationProfiles()
+        # rotation: {(column, row): placement}. rotations with the same shape
+        # can reach the same placements
+        found = {}
+        for maskIndex, col in self.reachableStates(fp):
+            fp.setRotation(maskIndex)
+            fp.moveTo(state[1], col)
+            rotation, profile = rotationProfiles[maskIndex]
+            rowOffset, colOffset = profile[3], profile[4]
+            placements = found.setdefault(rotation, {})
+            column = col - colOffset
+            row = self.landingRow(fp, profile, column, surface)
+            if row < 0 or (column, row) in placements:
+                continue
+            board, linesCleared = self.boardAfterPlacement(fp, row+rowOffset, col)
+            placements[(column, row)] = Placement(rotation, column, row, board,
+                    linesCleared)
+        fp.setRotation(state[0])
+        fp.moveTo(state[1], state[2])
+        return [placement for profile in fp.placementProfiles()
+                for placement in found.get(profile[0], {}).values()]
+
+    # the (maskIndex, col) the piece fp can get to without leaving its row,
+    # by a breadth-first search over tryMoveLeft, tryMoveRight and
+    # tryRotateClockwise. fp is left where it was
+    def reachableStates(self, fp):
+        row = fp.row
+        start = fp.maskIndex, fp.col
+        if not fp.fitsOnBoard():
+            return []
+        reached = [start]
+        seen = {start}
+        for maskIndex, col in reached:
+            for move in (fp.tryMoveLeft, fp.tryMoveRight, fp.tryRotateClockwise):
+                fp.setRotation(maskIndex)
+                fp.moveTo(row, col)
+                if move():
+                    state = fp.maskIndex, fp.col
+                    if state not in seen:
+                        seen.add(state)
+                        reached.append(state)
+        fp.setRotation(start[0])
+        fp.moveTo(row, start[1])
+        return reached
+
+    def boardAfterPlacement(self, fp, row, col):
+        board = self.board.copy()
+        ar, ac = fp.anchor
+        for r, c in fp.mask:
+            board[row+r-ar, col+c-ac] = fp.rep
+        complete = (board != 0).all(axis=1)
+        linesCleared = int(complete.sum())
+        if linesCleared > 0:
+            board = np.vstack((np.zeros((linesCleared, self.cols), dtype=board.dtype),
+                board[~complete]))
+        return board, linesCleared
+
+    # puts the falling piece down at the placement with the given rotation and
+    # leftmost column, as if it was moved there and dropped. returns the
+    # number of deleted rows
+    def commitPlacement(self, rotation, column):
+        fp = self.fallingPiece
+        for profile in fp.placementProfiles():
+            if profile[0] == rotation:
+                break
+        else:
+            raise ValueError("rotation {} is not a placement of {}".format(
+                rotation, type(fp).__name__))
+        rotation, width, bottom, rowOffset, colOffset = profile
+        fp.setRotation(rotation)
+        row = self.landingRow(fp, profile, column, self.columnSurface())
+        fp.moveTo(row+rowOffset, column+colOffset)
+        return self.lockFallingPiece()
+
+    # the whole state of the game as a small immutable value, e.g. for
+    # search controllers that try moves and then go back to where they were
+    def snapshot(self):
+        fp = self.fallingPiece
+        return Snapshot(self.board.astype(np.uint8).tobytes(),
+                self.pieceIndex[type(fp)], fp.maskIndex, fp.row, fp.col,
+                self.score, self.piecesPlaced, self.gameOver,
+                self.pieceSequence.getstate(),
+                tuple(observer.getstate() for observer in self.observers))
+
+    # puts the game back into the state of a snapshot. the board is
+    # overwritten in place and the falling piece is one kept per class for
+    # restores, so no new objects are made. observers get their state back
+    # through setstate, or are told through boardLoaded if the snapshot has
+    # none for them
+    def restore(self, snapshot):
+        board = np.frombuffer(snapshot.board, dtype=np.uint8)
+        self.board[...] = board.reshape(self.rows, self.cols)
+        self.loadBoard(self.board, snapshot.observerStates)
+        fp = self.piecePool[snapshot.piece]
+        if fp is None:
+            fp = self.tetriminos[snapshot.piece](self, 0, 0)
+            self.piecePool[snapshot.piece] = fp
+        fp.setRotation(snapshot.rotation)
+        fp.moveTo(snapshot.row, snapshot.col)
+        self.fallingPiece = fp
+        self.score = snapshot.score
+        self.piecesPlaced = snapshot.piecesPlaced
+        self.gameOver = snapshot.gameOver
+        self.pieceSequence.setstate(snapshot.pieceState)
+
     def makeBoard(self, rows, cols):
         return np.zeros((rows,cols), dtype=int)
 
@@ -129,11 +343,38 @@ class Tetris:
          
     def newBoard(self):
         self.board = self.makeBoard(self.rows, self.cols)
+        self.updateColumnTops()
+
+    # replaces the board, e.g. with a saved one
+    # observerStates: TetrisObserver.getstate of every observer for this
+    #   board, None to have them rescan it
+    def loadBoard(self, board, observerStates=None):
+        self.board = board
+        self.updateColumnTops()
+        if observerStates is None or len(observerStates) != len(self.observers):
+            for observer in self.observers:
+                observer.boardLoaded()
+        else:
+            for observer, state in zip(self.observers, observerStates):
+                observer.setstate(state)
+
+    # columnTops[c] is the index of the topmost occupied row of column c, or
+    # rows if it is empty. kept up to date by placeFallingPiece and
+    # deleteCompleteRows
+    def updateColumnTops(self):
+        occupied = self.board != 0
+        self.columnTops = np.where(occupied.any(axis=0),
+                occupied.argmax(axis=0), self.rows).tolist()
+
+    # the index in tetriminos of the piece that follows the falling one
+    def nextPieceIndex(self):
+        return self.pieceSequence.peekPiece()[0]
 
     def newFallingPiece(self):
-        clazz = self.tetriminos[self.rng.randint(0, self.numTetriminos-1)]
+        piece, rotations = self.pieceSequence.nextPiece()
+        clazz = self.tetriminos[piece]
         self.fallingPiece = clazz(self,-self.maxDimOfTetrimino+1,self.cols//2-1)
-        for i in range(self.rng.randint(0,3)):
+        for i in range(rotations):
             self.fallingPiece.rotateClockwise()
         while self.fallingPiece.minRow() != 0:
             self.fallingPiece.moveDown()
@@ -143,12 +384,40 @@ class Tetris:
         ar, ac = fp.anchor
         dr, dc = fp.row-ar, fp.col-ac
         rep = fp.rep
+        columnTops = self.columnTops
         for r,c in fp.mask:
             self.board[r+dr][c+dc] = rep
+            if r+dr < columnTops[c+dc]:
+                columnTops[c+dc] = r+dr
+        self.piecesPlaced += 1
+        if self.observers:
+            cells = list(fp)
+            for observer in self.observers:
+                observer.piecePlaced(cells)
 
     def dim(self):
         return self.rows, self.cols
 
+# Gets told about changes to a Tetris board, so that derived state can be
+# kept up to date without rescanning the board. Register with addObserver.
+class TetrisObserver:
+
+    # cells: (row, col) of the piece just written to the board
+    def piecePlaced(self, cells): pass
+
+    # rows: indices, before deletion, of the complete rows just removed
+    def rowsDeleted(self, rows): pass
+
+    # the whole board was replaced, by loadBoard or restore
+    def boardLoaded(self): pass
+
+    # what Tetris.snapshot keeps of the observer's state, so that restore
+    # can hand it to setstate instead of calling boardLoaded
+    def getstate(self): return None
+
+    def setstate(self, state):
+        self.boardLoaded()
+
 class Tetrimino:
     color = "black"
     shadowColor = "black"
@@ -167,6 +436,65 @@ class Tetrimino:
         self.mask = self.masks[self.maskIndex]
         self.anchor = self.anchors[self.maskIndex]
 
+    def setRotation(self, maskIndex):
+        self.maskIndex = maskIndex
+        self.mask = self.masks[maskIndex]
+        self.anchor = self.anchors[maskIndex]
+
+    # (left, lows) for every maskIndex: left is the column offset of the
+    # piece's leftmost cells from col and lows[j] the row offset from row of
+    # the lowest cell in column col+left+j
+    @classmethod
+    def bottomProfiles(cls):
+        if "bottoms" not in cls.__dict__:
+            bottoms = []
+            for mask, (ar, ac) in zip(cls.masks, cls.anchors):
+                left = min(c for r, c in mask) - ac
+                right = max(c for r, c in mask) - ac
+                lows = [max(r-ar for r, c in mask if c-ac == j)
+                        for j in range(left, right+1)]
+                bottoms.append((left, lows))
+            cls.bottoms = tuple(bottoms)
+        return cls.bottoms
+
+    # (rotation, width, bottom, rowOffset, colOffset) for every rotation
+    # giving a distinct shape. bottom[j] is the lowest cell of column j
+    # counted from the top of the piece, and piece.row, piece.col are
+    # top+rowOffset, left+colOffset when the piece's cells start at top, left
+    @classmethod
+    def placementProfiles(cls):
+        if "profiles" not in cls.__dict__:
+            t = cls(None, 0, 0)
+            profiles = []
+            rotations = {}
+            # shape: the first rotation giving it
+            shapes = {}
+            for i in range(4):
+                rmin = min(r for r, c in t.mask)
+                cmin = min(c for r, c in t.mask)
+                shape = frozenset((r-rmin, c-cmin) for r, c in t.mask)
+                width = max(c for r, c in shape) + 1
+                bottom = [max(r for r, c in shape if c == j) for j in range(width)]
+                ar, ac = t.anchor
+                profile = (t.maskIndex, width, bottom, ar-rmin, ac-cmin)
+                if shape not in shapes:
+                    shapes[shape] = t.maskIndex
+                    profiles.append(profile)
+                rotations[t.maskIndex] = (shapes[shape], profile)
+                t.rotateClockwise()
+                if t.maskIndex == 0:
+                    break
+            cls.profiles = tuple(profiles)
+            cls.rotations = rotations
+        return cls.profiles
+
+    # for every maskIndex the rotation in placementProfiles with the same
+    # shape, and the maskIndex's own profile
+    @classmethod
+    def rotationProfiles(cls):
+        cls.placementProfiles()
+        return cls.rotations
+
     def rotateClockwise(self):
         self.maskIndex += 1
         self.maskIndex %= 4
@@ -217,15 +545,9 @@ class Tetrimino:
             yield (dr+row, dc+col) 
     
     def shadow(self):
-        originalRow, originalCol = self.row, self.col
-        dRow = 0 
+        dRow = 0
         if self.fitsOnBoard():
-            while self.fitsOnBoard():
-                dRow += 1
-                self.moveDown()
-            self.moveUp()
-            dRow -= 1
-            self.moveTo(originalRow, originalCol)
+            dRow = self.game.dropDistance(self)
         for row, col in self:
             yield row+dRow, col
 
@@ -1,7 +1,15 @@
 import neat
-from controller import Controller
+from controller import Controller, SparseController, PlacementController, \
+        BatchController, FeatureController
 from tetris import Tetris
 from automatedTetris import AutomatedTetris, AutomatedTetrisWindow
+from compiledNetwork import compileNetwork
+import instrumentation
+from checkpoint import BackgroundCheckpointer, latestCheckpoint, \
+        restoreCheckpoint, ResumedEvaluator
+from steadyState import SteadyStateEvolution
+from pieceSequence import ArrayPieceSequence, pieceTable
+from features import numFeatures
 import pickle
 import numpy as np
 import random
@@ -12,7 +20,9 @@ class NeuralNetworkController(Controller):
         self.net = net
 
     def getMove(self, board):
-        outputs = self.net.activate(board)
+        return self.chooseMove(self.net.activate(board))
+
+    def chooseMove(self, outputs):
         move = Tetris.DOWN
         #print(outputs)
         for m in Tetris.POSSIBLE_MOVES:
@@ -20,43 +30,165 @@ class NeuralNetworkController(Controller):
                 move = m
         return move
 
+# The moves NeuralNetworkController would choose for a batch of boards, with
+# all boards in one activateBatch call of a compiled network. Other networks
+# are activated one board at a time.
+class BatchNeuralNetworkController(BatchController):
+
+    def __init__(self, net):
+        self.net = net
+
+    def getMoves(self, boards):
+        if hasattr(self.net, "activateBatch"):
+            outputs = self.net.activateBatch(boards)
+        else:
+            outputs = np.array([self.net.activate(board) for board in boards])
+        return self.chooseMoves(outputs)
+
+    # chooseMove for every row: the first of the best outputs, but DOWN
+    # whenever it is one of the best
+    def chooseMoves(self, outputs):
+        outputs = outputs[:, Tetris.POSSIBLE_MOVES]
+        moves = np.array(Tetris.POSSIBLE_MOVES)[np.argmax(outputs, axis=1)]
+        down = Tetris.POSSIBLE_MOVES.index(Tetris.DOWN)
+        moves[outputs[:, down] >= outputs.max(axis=1)] = Tetris.DOWN
+        return moves
+
+# for compiled networks, see compiledNetwork.CompiledNetwork.activateSparse
+class SparseNeuralNetworkController(NeuralNetworkController, SparseController):
+
+    def getMoveSparse(self, activeIndices):
+        return self.chooseMove(self.net.activateSparse(activeIndices))
+
+# for networks with the engineered inputs of features.BoardFeatures
+class FeatureNeuralNetworkController(NeuralNetworkController, FeatureController):
+
+    def getMoveFeatures(self, features):
+        return self.chooseMove(self.net.activate(features))
+
+# Scores the board each placement leaves with the first output of a
+# compiled network, all placements in one activateBatch call
+class NeuralNetworkPlacementController(PlacementController):
+
+    def __init__(self, net):
+        self.net = net
+
+    def getPlacement(self, placements):
+        boards = np.array([np.minimum(1, p.board).ravel() for p in placements])
+        values = self.net.activateBatch(boards)[:, 0]
+        return placements[int(np.argmax(values))]
+
 TRIALS_PER_GENOME = 1
 
-def eval_genomes(genomes, config):
+def buildNetwork(genome, config):
+    return compileNetwork(neat.nn.FeedForwardNetwork.create(genome, config))
+
+# the controller for net: configs whose num_inputs is the number of
+# features, like train_config_features, play with the features instead of
+# the board
+def networkController(net, config):
+    if config.genome_config.num_inputs == numFeatures(Tetris.DEFAULT_COLS):
+        return FeatureNeuralNetworkController(net)
+    return NeuralNetworkController(net)
+
+# cache: a fitnessCache.FitnessCache, so trials an identical network already
+#   played are not played again. trial i has the same pieces as in
+#   parallelEval, so both can share a cache:
+#   p.run(functools.partial(eval_genomes, cache=FitnessCache()), 1000)
+def eval_genomes(genomes, config, cache=None):
+    # have the net play for at most 10 minutes
+    maxMoves = AutomatedTetris.FPS*600
+    # trial i's pieces are those random.seed(i) would give, drawn once for
+    # all genomes. a game places at most maxMoves+1 pieces
+    trialStates = [random.Random(i).getstate() for i in range(TRIALS_PER_GENOME)]
+    pieceTables = [pieceTable(state, maxMoves+1) for state in trialStates]
+    # InstrumentedAutomatedTetris while instrumentation is enabled
+    gameClass = instrumentation.automatedTetrisClass()
+    phaseProfile = instrumentation.profile
     for genome_id, genome in genomes:
-        net = neat.nn.FeedForwardNetwork.create(genome, config)
-        controller = NeuralNetworkController(net)
         scores = np.empty((TRIALS_PER_GENOME,1))
+        keys = [None]*TRIALS_PER_GENOME
+        cached = [None]*TRIALS_PER_GENOME
+        if cache is not None:
+            keys = [cache.key(genome, i, maxMoves) for i in range(TRIALS_PER_GENOME)]
+            cached = [cache.get(key) for key in keys]
+        controller = None
         for i in range(TRIALS_PER_GENOME):
-            random.seed(i)
-            initrandomstate = random.getstate()
-            autoTetris = AutomatedTetris(controller, initrandomstate=initrandomstate,
-                    recordMoves=False)
-            # have the net play for at most 10 minutes
-            autoTetris.play(maxMoves=AutomatedTetris.FPS*600)
+            if cached[i] is not None:
+                scores[i] = cached[i]
+                continue
+            if controller is None:
+                if phaseProfile is None:
+                    net = buildNetwork(genome, config)
+                else:
+                    net = phaseProfile.call("network", buildNetwork, genome, config)
+                controller = networkController(net, config)
+            autoTetris = gameClass(controller, recordMoves=False,
+                    pieceSequence=ArrayPieceSequence(pieceTables[i],
+                        initrandomstate=trialStates[i]))
+            autoTetris.play(maxMoves=maxMoves)
             #print(autoTetris.moves)
             scores[i] = autoTetris.score()
             #+ autoTetris.gameLength/100.
+            if cache is not None:
+                cache.put(keys[i], autoTetris.score())
         
         genome.fitness = np.mean(scores)
+    if cache is not None:
+        cache.sync()
+    if genomes:
+        # the trials used to be started with random.seed(i), which left the
+        # global random state at the last trial's seed for reproduction;
+        # kept so runs with the same seed still evolve the same way
+        random.seed(TRIALS_PER_GENOME-1)
 
 
-def run(config_file):
+# evaluator: called as evaluator(genomes, config) each generation, e.g.
+#   eval_genomes or a parallelEval.ParallelEvaluator
+# profile: print where the time of each generation went, see instrumentation.py
+# stackFile: sample the stacks of the run into this file for a flamegraph
+# checkpointPrefix: where every generation is checkpointed, see checkpoint.py
+# resume: continue from the latest checkpoint, if there is one
+# steadyState: breed and evaluate one genome at a time instead of whole
+#   generations, see steadyState.py. evaluator must be a ParallelEvaluator
+def run(config_file, evaluator=eval_genomes, profile=False, stackFile=None,
+        checkpointPrefix="neat-checkpoint-", resume=False, steadyState=False):
+    if steadyState and not hasattr(evaluator, "submitGenome"):
+        raise ValueError("steady-state evolution needs an evaluator with "
+                "submitGenome, e.g. a ParallelEvaluator")
     # Load configuration.
     config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
                          neat.DefaultSpeciesSet, neat.DefaultStagnation,
                          config_file)
 
-    # Create the population, which is the top-level object for a NEAT run.
-    p = neat.Population(config)
+    checkpointer = BackgroundCheckpointer(checkpointPrefix)
+    if resume and latestCheckpoint(checkpointPrefix) is not None:
+        p = restoreCheckpoint(checkpointPrefix, config, checkpointer)
+        if not steadyState:
+            evaluator = ResumedEvaluator(evaluator)
+    else:
+        # Create the population, which is the top-level object for a NEAT run.
+        p = neat.Population(config)
 
     # Add a stdout reporter to show progress in the terminal.
     p.add_reporter(neat.StdOutReporter(True))
     stats = neat.StatisticsReporter()
     p.add_reporter(stats)
-    p.add_reporter(neat.Checkpointer(100))
+    p.add_reporter(checkpointer)
+    if profile:
+        p.add_reporter(instrumentation.PhaseReporter())
 
-    winner = p.run(eval_genomes, 1000)
+    if steadyState:
+        # evaluated genomes, e.g. restored ones, are not evaluated again
+        runner = SteadyStateEvolution(p).run
+    else:
+        runner = p.run
+    if stackFile is None:
+        winner = runner(evaluator, 1000)
+    else:
+        with instrumentation.StackSampler(stackFile):
+            winner = runner(evaluator, 1000)
+    checkpointer.close()
 
     # Display the winning genome.
     #print('\nBest genome:\n{!s}'.format(winner))
@@ -69,12 +201,23 @@ def run(config_file):
 def playNet(filename):
     with open(filename, "rb") as f:
         winner_net = pickle.load(f)
-        controller = NeuralNetworkController(winner_net) 
+        controller = NeuralNetworkController(compileNetwork(winner_net))
         random.seed(0)
         initrandomstate = random.getstate()
         autoTetris = AutomatedTetris(controller, initrandomstate=initrandomstate)
         AutomatedTetrisWindow(autoTetris).play()
 
 
-#run("train_config")
-playNet("winner.net")
+if __name__ == "__main__":
+    #run("train_config")
+    #run("train_config_features")
+    #from parallelEval import ParallelEvaluator
+    #import functools
+    #from fitnessCache import FitnessCache
+    #run("train_config", ParallelEvaluator(cache=FitnessCache(filename="fitness.cache")))
+    #run("train_config", functools.partial(eval_genomes, cache=FitnessCache()))
+    #from distributed import DistributedEvaluator
+    # workers on other machines need TETRIS_WORKER_KEY set here and there
+    #run("train_config", DistributedEvaluator(host="0.0.0.0", port=5555))
+    #run("train_config", ParallelEvaluator(), steadyState=True)
+    playNet("winner.net")
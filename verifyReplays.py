@@ -0,0 +1,66 @@
+from automatedTetris import AutomatedTetrisMovie
+from bitboardTetris import BitboardTetris
+from replay import isReplayFile
+from tetris import TetrisObserver
+from multiprocessing import Pool
+import json
+import os
+import sys
+
+# Replays every binary replay file in a directory as fast as the engine
+# allows, without a window and on several processes, and checks that the
+# final scores and lengths match the ones the files recorded. Prints one
+# JSON summary per game followed by a total.
+#   python verifyReplays.py DIRECTORY [WORKERS]
+
+class ClearCounter(TetrisObserver):
+    def __init__(self):
+        self.counts = [0]*5
+
+    def rowsDeleted(self, rows):
+        self.counts[len(rows)] += 1
+
+def verifyReplay(filename, tetrisClass=BitboardTetris):
+    movie = AutomatedTetrisMovie(filename, tetrisClass=tetrisClass)
+    # the movie's reader, the file is only opened and parsed once
+    reader = movie.replay
+    clears = ClearCounter()
+    movie.tetris.addObserver(clears)
+    if reader.end is not None:
+        movie.play(reader.end["gameLength"])
+    else:
+        # the writer never finished, play as far as the moves go
+        while movie.controller.index < reader.moveCount and movie.step(): pass
+    summary = {
+        "file": filename,
+        "score": movie.score(),
+        "length": movie.gameLength,
+        "piecesPlaced": movie.tetris.piecesPlaced,
+        "linesBySize": {size: clears.counts[size] for size in range(1, 5)},
+        "recorded": reader.end,
+    }
+    summary["ok"] = reader.end is not None and \
+            reader.end["score"] == summary["score"] and \
+            reader.end["gameLength"] == summary["length"] and \
+            reader.end["piecesPlaced"] == summary["piecesPlaced"]
+    return summary
+
+def replayFiles(directory):
+    names = sorted(os.listdir(directory))
+    paths = [os.path.join(directory, name) for name in names]
+    return [p for p in paths if os.path.isfile(p) and isReplayFile(p)]
+
+def verifyDirectory(directory, workers=None, chunkSize=16, out=sys.stdout):
+    files = replayFiles(directory)
+    total = mismatched = 0
+    with Pool(workers) as pool:
+        for summary in pool.imap_unordered(verifyReplay, files, chunkSize):
+            total += 1
+            mismatched += not summary["ok"]
+            out.write(json.dumps(summary) + "\n")
+    out.write(json.dumps({"games": total, "mismatched": mismatched}) + "\n")
+    return mismatched
+
+if __name__ == "__main__":
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    sys.exit(1 if verifyDirectory(sys.argv[1], workers) else 0)
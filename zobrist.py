@@ -0,0 +1,146 @@
+from tetris import TetrisObserver
+from pieceSequence import mix64, MASK64
+import numpy as np
+
+# Zobrist hashing of Tetris states: every row of the board and every
+# (piece, rotation, row, col) of the falling piece has a random 64 bit key,
+# and a state's hash is the xor of its keys. A row's key depends on its
+# index and on which of its cells are occupied, not on which piece's color
+# they have, and empty rows have none.
+
+# Keeps the hash of a game's board up to date as an observer. Placing a
+# piece swaps the keys of the rows it touched. Deleting rows moves the rows
+# above them down, so only the occupied rows that moved swap keys, without
+# looking at the board. Snapshots carry the hash, so a restore puts it back
+# as it was, and only boards loaded from elsewhere are hashed from scratch.
+# The falling piece's key is looked up when the hash is asked for, so
+# moving it costs nothing.
+#   zobrist = ZobristHash(tetris)
+#   table.put(zobrist.key(), depth, value)
+class ZobristHash(TetrisObserver):
+
+    def __init__(self, tetris, seed=0):
+        self.tetris = tetris
+        self.seed = seed
+        self.rowKeys = {}
+        self.pieceKeys = {}
+        self.boardLoaded()
+        tetris.addObserver(self)
+
+    def rowKey(self, row, bits):
+        if bits == 0:
+            return 0
+        key = self.rowKeys.get((row, bits))
+        if key is None:
+            tetris = self.tetris
+            key = mix64((((self.seed*tetris.rows + row) << tetris.cols) | bits) + 1
+                    & MASK64)
+            self.rowKeys[(row, bits)] = key
+        return key
+
+    def piecePlaced(self, cells):
+        rowBits = self.rowBits
+        changed = {}
+        for r, c in cells:
+            changed[r] = changed.get(r, rowBits[r]) | (1 << c)
+        for r, bits in changed.items():
+            self.boardHash ^= self.rowKey(r, rowBits[r]) ^ self.rowKey(r, bits)
+            rowBits[r] = bits
+
+    def rowsDeleted(self, rows):
+        deleted = set(rows)
+        old = self.rowBits
+        new = [0]*len(rows) + [bits for r, bits in enumerate(old) if r not in deleted]
+        for r in range(max(rows)+1):
+            if old[r] != new[r]:
+                self.boardHash ^= self.rowKey(r, old[r]) ^ self.rowKey(r, new[r])
+        self.rowBits = new
+
+    def boardLoaded(self):
+        tetris = self.tetris
+        occupied = tetris.board != 0
+        self.rowBits = [sum(1 << c for c in np.flatnonzero(row).tolist())
+                for row in occupied]
+        self.boardHash = 0
+        for r, bits in enumerate(self.rowBits):
+            self.boardHash ^= self.rowKey(r, bits)
+
+    def getstate(self):
+        return self.boardHash, tuple(self.rowBits)
+
+    def setstate(self, state):
+        self.boardHash, rowBits = state
+        self.rowBits = list(rowBits)
+
+    def pieceKey(self, fp):
+        state = (self.tetris.pieceIndex[type(fp)], fp.maskIndex, fp.row, fp.col)
+        key = self.pieceKeys.get(state)
+        if key is None:
+            piece, rotation, row, col = state
+            # rows and cols can be a few cells off the board
+            key = mix64(((self.seed << 32) ^ (piece << 24) ^ (rotation << 16)
+                    ^ ((row & 0xff) << 8) ^ (col & 0xff)) + MASK64//3 & MASK64)
+            self.pieceKeys[state] = key
+        return key
+
+    # the hash of the board and the falling piece
+    def key(self):
+        return self.boardHash ^ self.pieceKey(self.tetris.fallingPiece)
+
+# Remembers values of searched states with bounded memory. The table has
+# 2**sizeBits buckets of ways entries each, picked by the low bits of the
+# key. When a bucket is full a new entry replaces the one searched to the
+# smallest depth, unless all of them were searched deeper, so the expensive
+# results stay.
+class TranspositionTable:
+
+    EMPTY = -1
+
+    def __init__(self, sizeBits=16, ways=4):
+        self.mask = (1 << sizeBits) - 1
+        self.ways = ways
+        size = (1 << sizeBits) * ways
+        self.keys = [None]*size
+        self.depths = [TranspositionTable.EMPTY]*size
+        self.values = [None]*size
+        self.hits = 0
+        self.misses = 0
+
+    # the value stored for key if it was searched at least depth deep, or None
+    def get(self, key, depth=0):
+        start = (key & self.mask) * self.ways
+        keys = self.keys
+        for i in range(start, start + self.ways):
+            if keys[i] == key and self.depths[i] >= depth:
+                self.hits += 1
+                return self.values[i]
+        self.misses += 1
+        return None
+
+    def put(self, key, depth, value):
+        start = (key & self.mask) * self.ways
+        keys, depths = self.keys, self.depths
+        shallowest = start
+        for i in range(start, start + self.ways):
+            if keys[i] == key:
+                if depth >= depths[i]:
+                    depths[i] = depth
+                    self.values[i] = value
+                return
+            if depths[i] < depths[shallowest]:
+                shallowest = i
+        if depth >= depths[shallowest]:
+            keys[shallowest] = key
+            depths[shallowest] = depth
+            self.values[shallowest] = value
+
+    def clear(self):
+        size = len(self.keys)
+        self.keys = [None]*size
+        self.depths = [TranspositionTable.EMPTY]*size
+        self.values = [None]*size
+
+    def report(self):
+        used = sum(1 for d in self.depths if d != TranspositionTable.EMPTY)
+        return "TranspositionTable: {} hits, {} misses, {}/{} entries used".format(
+                self.hits, self.misses, used, len(self.keys))